@@ -0,0 +1,283 @@
+"""
+Audit log retention: monthly partitions on Postgres, cold archive on local disk.
+
+Postgres: `install` turns audit_logs into a table partitioned by month on
+"timestamp" (migrating an existing plain table in place) and keeps
+AUDIT_PARTITIONS_AHEAD months of partitions ready; while the app runs, `start`
+re-checks every AUDIT_PARTITION_CHECK_SECONDS, so a long-lived process never
+reaches a month without a partition even if the cron job stops. `archive_expired` exports every
+partition older than AUDIT_RETENTION_DAYS to gzip NDJSON, then detaches and drops
+it, so the hot table never holds more than the retention window.
+Other databases (SQLite in the tests and local runs): same export, then a DELETE of
+the archived rows.
+
+Archived months stay readable through `iter_archived`. Run the job from cron:
+
+    python audit_archive.py archive
+    python audit_archive.py read --since 2024-01-01 --until 2024-02-01
+"""
+import argparse
+import asyncio
+import contextlib
+import gzip
+import json
+import logging
+import os
+import re
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, text
+
+import models
+from database import engine
+
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "365"))
+AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", "./audit_archive")
+AUDIT_PARTITIONS_AHEAD = int(os.getenv("AUDIT_PARTITIONS_AHEAD", "3"))
+AUDIT_PARTITION_CHECK_SECONDS = float(os.getenv("AUDIT_PARTITION_CHECK_SECONDS", "3600"))
+
+logger = logging.getLogger(__name__)
+_maintainer = None
+
+_table = models.AuditLog.__table__
+_columns = [column.name for column in _table.columns]
+_PARTITION_RE = re.compile(r"^audit_logs_y(\d{4})m(\d{2})$")
+_ARCHIVE_RE = re.compile(r"^audit_logs_(\d{4})-(\d{2})(?:\.(\d+))?\.ndjson\.gz$")
+
+
+def _month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def _next_month(month: datetime) -> datetime:
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _partition_name(month: datetime) -> str:
+    return f"audit_logs_y{month:%Y}m{month:%m}"
+
+
+def _is_partitioned(conn) -> bool:
+    return bool(conn.execute(
+        text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('audit_logs')")
+    ).scalar())
+
+
+def ensure_partitions(conn, start: datetime = None):
+    """Create the monthly partitions from `start` (default: this month) to AUDIT_PARTITIONS_AHEAD months ahead."""
+    month = _month_start(start or datetime.utcnow())
+    last = _month_start(datetime.utcnow())
+    for _ in range(AUDIT_PARTITIONS_AHEAD):
+        last = _next_month(last)
+    while month <= last:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {_partition_name(month)} PARTITION OF audit_logs "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')"
+        ))
+        month = _next_month(month)
+
+
+def _partition_legacy_table(conn):
+    # The plain table becomes audit_logs_legacy; its index and primary key names are
+    # freed first since Postgres index names are schema-wide.
+    for index in _table.indexes:
+        conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    conn.execute(text("ALTER TABLE audit_logs RENAME TO audit_logs_legacy"))
+    conn.execute(text("ALTER TABLE audit_logs_legacy RENAME CONSTRAINT audit_logs_pkey TO audit_logs_legacy_pkey"))
+    # The partition key has to be part of the primary key
+    conn.execute(text("""
+        CREATE TABLE audit_logs (
+            id INTEGER NOT NULL DEFAULT nextval('audit_logs_id_seq'),
+            action VARCHAR,
+            target_type VARCHAR,
+            target_id INTEGER,
+            details VARCHAR,
+            "timestamp" TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            user_id INTEGER REFERENCES users (id),
+            PRIMARY KEY (id, "timestamp")
+        ) PARTITION BY RANGE ("timestamp")
+    """))
+    # Otherwise dropping the legacy table would drop the id sequence with it
+    conn.execute(text("ALTER SEQUENCE audit_logs_id_seq OWNED BY audit_logs.id"))
+    oldest = conn.execute(text('SELECT min("timestamp") FROM audit_logs_legacy')).scalar()
+    ensure_partitions(conn, oldest)
+    columns = ", ".join(f'"{name}"' for name in _columns)
+    # Rows without a timestamp would match no partition
+    values = columns.replace('"timestamp"', """coalesce("timestamp", now() at time zone 'utc')""")
+    conn.execute(text(f"INSERT INTO audit_logs ({columns}) SELECT {values} FROM audit_logs_legacy"))
+    conn.execute(text("DROP TABLE audit_logs_legacy"))
+    # Created on the parent, propagated to every partition
+    for index in _table.indexes:
+        index.create(conn)
+
+
+def install(engine):
+    """Partition audit_logs by month (Postgres only) and create upcoming partitions. Idempotent."""
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as conn:
+        if not _is_partitioned(conn):
+            _partition_legacy_table(conn)
+        ensure_partitions(conn)
+
+
+def _ensure_upcoming(bind):
+    with bind.begin() as conn:
+        ensure_partitions(conn)
+
+
+async def _maintain(bind):
+    while True:
+        await asyncio.sleep(AUDIT_PARTITION_CHECK_SECONDS)
+        try:
+            await asyncio.to_thread(_ensure_upcoming, bind)
+        except Exception:
+            # Retried next round; AUDIT_PARTITIONS_AHEAD months leave plenty of margin
+            logger.exception("Could not create the upcoming audit partitions")
+
+
+def start(bind=None):
+    """Keep the upcoming partitions created while the process runs (Postgres only)."""
+    global _maintainer
+    bind = bind or engine
+    if _maintainer is None and bind.dialect.name == "postgresql":
+        _maintainer = asyncio.create_task(_maintain(bind))
+    return _maintainer
+
+
+async def stop():
+    global _maintainer
+    if _maintainer is not None:
+        _maintainer.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _maintainer
+        _maintainer = None
+
+
+def _archive_path(archive_dir: str, month: datetime) -> str:
+    base = os.path.join(archive_dir, f"audit_logs_{month:%Y-%m}")
+    path, n = base + ".ndjson.gz", 0
+    # A month archived twice (rows that arrived late) gets a numbered second file
+    while os.path.exists(path):
+        n += 1
+        path = f"{base}.{n}.ndjson.gz"
+    return path
+
+
+def _export_month(conn, month: datetime, archive_dir: str) -> int:
+    """Stream one month of audit rows to a gzip NDJSON file. Returns the row count."""
+    stmt = (
+        select(_table)
+        .where(_table.c.timestamp >= month, _table.c.timestamp < _next_month(month))
+        .order_by(_table.c.timestamp, _table.c.id)
+    )
+    path = _archive_path(archive_dir, month)
+    count = 0
+    with gzip.open(path + ".tmp", "wt", encoding="utf-8") as out:
+        for row in conn.execution_options(stream_results=True, yield_per=1000).execute(stmt):
+            entry = dict(row._mapping)
+            entry["timestamp"] = entry["timestamp"].isoformat()
+            out.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            count += 1
+    if count:
+        with open(path + ".tmp", "rb") as written:
+            os.fsync(written.fileno())
+        os.replace(path + ".tmp", path)
+    else:
+        os.remove(path + ".tmp")
+    return count
+
+
+def _expired_months(conn, cutoff: datetime):
+    if conn.dialect.name == "postgresql":
+        names = conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'audit_logs'::regclass"
+        )).scalars()
+        months = sorted(
+            datetime(int(m.group(1)), int(m.group(2)), 1)
+            for m in map(_PARTITION_RE.match, names) if m
+        )
+        return [month for month in months if _next_month(month) <= cutoff]
+    oldest = conn.execute(select(func.min(_table.c.timestamp))).scalar()
+    months = []
+    month = _month_start(oldest) if oldest else cutoff
+    while _next_month(month) <= cutoff:
+        months.append(month)
+        month = _next_month(month)
+    return months
+
+
+def archive_expired(bind=None, now: datetime = None, archive_dir: str = None) -> dict:
+    """
+    Export every whole month older than the retention window, then remove it from
+    the hot table. Each month is exported and dropped in one transaction, and the
+    file is fsynced before the drop commits. Returns {"YYYY-MM": rows archived}.
+    """
+    bind = bind or engine
+    archive_dir = archive_dir or AUDIT_ARCHIVE_DIR
+    os.makedirs(archive_dir, exist_ok=True)
+    cutoff = (now or datetime.utcnow()) - timedelta(days=AUDIT_RETENTION_DAYS)
+    archived = {}
+    with bind.connect() as conn:
+        months = _expired_months(conn, cutoff)
+    for month in months:
+        with bind.begin() as conn:
+            archived[f"{month:%Y-%m}"] = _export_month(conn, month, archive_dir)
+            if conn.dialect.name == "postgresql":
+                name = _partition_name(month)
+                conn.execute(text(f"ALTER TABLE audit_logs DETACH PARTITION {name}"))
+                conn.execute(text(f"DROP TABLE {name}"))
+            else:
+                conn.execute(_table.delete().where(
+                    _table.c.timestamp >= month, _table.c.timestamp < _next_month(month)
+                ))
+    if bind.dialect.name == "postgresql":
+        _ensure_upcoming(bind)
+    return archived
+
+
+def iter_archived(since: datetime = None, until: datetime = None, archive_dir: str = None):
+    """
+    Yield archived entries (dicts, "timestamp" as a datetime) with since <= timestamp
+    < until, month by month. Reads one line at a time; only files whose month
+    overlaps the range are opened.
+    """
+    archive_dir = archive_dir or AUDIT_ARCHIVE_DIR
+    if not os.path.isdir(archive_dir):
+        return
+    files = []
+    for name in os.listdir(archive_dir):
+        match = _ARCHIVE_RE.match(name)
+        if match:
+            month = datetime(int(match.group(1)), int(match.group(2)), 1)
+            files.append((month, int(match.group(3) or 0), name))
+    for month, _, name in sorted(files):
+        if (since and _next_month(month) <= since) or (until and month >= until):
+            continue
+        with gzip.open(os.path.join(archive_dir, name), "rt", encoding="utf-8") as archive:
+            for line in archive:
+                entry = json.loads(line)
+                entry["timestamp"] = datetime.fromisoformat(entry["timestamp"])
+                if (since and entry["timestamp"] < since) or (until and entry["timestamp"] >= until):
+                    continue
+                yield entry
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("archive", help="archive and drop months older than AUDIT_RETENTION_DAYS")
+    read = commands.add_parser("read", help="print archived entries as NDJSON")
+    read.add_argument("--since", type=datetime.fromisoformat)
+    read.add_argument("--until", type=datetime.fromisoformat)
+    args = parser.parse_args()
+
+    if args.command == "archive":
+        for month, count in archive_expired().items():
+            print(f"{month}: {count} rows archived")
+    else:
+        for entry in iter_archived(args.since, args.until):
+            entry["timestamp"] = entry["timestamp"].isoformat()
+            sys.stdout.write(json.dumps(entry) + "\n")
@@ -0,0 +1,151 @@
+"""
+Audit log writer, off the request's commit path.
+
+`record` is called before the business commit. In "buffered" mode (default) the
+entry rides in session.info and is handed to an in-process buffer only once that
+commit succeeds; a background task inserts buffered entries in bulk every
+AUDIT_BATCH_SIZE rows or AUDIT_FLUSH_INTERVAL_MS, whichever comes first. Entries
+still buffered when the process dies are lost. In "transactional" mode the entry is
+added to the business session and commits (or rolls back) with it, at the cost of
+one more INSERT in the request.
+
+When the buffer is full, or no flusher is running (scripts, tests without the app
+lifespan), `record` falls back to the transactional path instead of dropping.
+"""
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import event, insert
+
+import database
+import models
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# "buffered" or "transactional"
+AUDIT_DURABILITY = os.getenv("AUDIT_DURABILITY", "buffered")
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+AUDIT_FLUSH_INTERVAL_MS = int(os.getenv("AUDIT_FLUSH_INTERVAL_MS", "50"))
+AUDIT_QUEUE_MAXSIZE = int(os.getenv("AUDIT_QUEUE_MAXSIZE", "10000"))
+AUDIT_FLUSH_RETRIES = 3
+
+# Only touched from the event loop thread, no lock needed
+_buffer = deque()
+_has_entries = None
+_batch_full = None
+_task = None
+_stopping = False
+_stats = {"written": 0, "batches": 0, "failed": 0, "fallbacks": 0}
+
+
+def queue_depth() -> int:
+    return len(_buffer)
+
+
+def stats() -> dict:
+    return {"mode": AUDIT_DURABILITY, "queued": len(_buffer), "running": _task is not None, **_stats}
+
+
+registry.gauge("helpdesk_audit_queue_depth", "Audit entries waiting for the flusher", fn=queue_depth).labels()
+registry.counter("helpdesk_audit_written_total", "Audit entries written by the flusher", fn=lambda: _stats["written"]).labels()
+registry.counter("helpdesk_audit_failed_total", "Audit entries dropped after failed flushes", fn=lambda: _stats["failed"]).labels()
+
+
+def record(db, user_id: int, action: str, target_type: str, target_id: int, details: str = None):
+    """Queue one audit entry with the session's pending unit of work (see module docstring)."""
+    row = {
+        "user_id": user_id,
+        "action": action,
+        "target_type": target_type,
+        "target_id": target_id,
+        "details": details,
+        "timestamp": datetime.utcnow(),
+    }
+    if AUDIT_DURABILITY == "buffered" and _task is not None and len(_buffer) < AUDIT_QUEUE_MAXSIZE:
+        db.info.setdefault("audit_pending", []).append(row)
+        return
+    if AUDIT_DURABILITY == "buffered":
+        _stats["fallbacks"] += 1
+    db.add(models.AuditLog(**row))
+
+
+@event.listens_for(database.RoutingSession, "after_commit")
+def _enqueue_committed(session):
+    rows = session.info.pop("audit_pending", None)
+    if not rows:
+        return
+    _buffer.extend(rows)
+    _has_entries.set()
+    if len(_buffer) >= AUDIT_BATCH_SIZE:
+        _batch_full.set()
+
+
+@event.listens_for(database.RoutingSession, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("audit_pending", None)
+
+
+async def _write_batch():
+    rows = [_buffer.popleft() for _ in range(min(AUDIT_BATCH_SIZE, len(_buffer)))]
+    if _batch_full is not None and len(_buffer) < AUDIT_BATCH_SIZE:
+        _batch_full.clear()
+    for attempt in range(1, AUDIT_FLUSH_RETRIES + 1):
+        try:
+            async with database.AsyncSessionLocal() as db:
+                await db.execute(insert(models.AuditLog), rows)
+                await db.commit()
+            _stats["written"] += len(rows)
+            _stats["batches"] += 1
+            return
+        except Exception:
+            logger.exception("Audit batch of %d rows failed (attempt %d)", len(rows), attempt)
+            await asyncio.sleep(0.1 * attempt)
+    _stats["failed"] += len(rows)
+
+
+async def flush():
+    """Write everything buffered so far."""
+    while _buffer:
+        await _write_batch()
+
+
+async def _run():
+    while not _stopping or _buffer:
+        await _has_entries.wait()
+        if len(_buffer) < AUDIT_BATCH_SIZE and not _stopping:
+            try:
+                await asyncio.wait_for(_batch_full.wait(), AUDIT_FLUSH_INTERVAL_MS / 1000)
+            except asyncio.TimeoutError:
+                pass
+        if _buffer:
+            await _write_batch()
+        if not _buffer and not _stopping:
+            _has_entries.clear()
+
+
+def start():
+    """Start the flusher on the running event loop (app lifespan)."""
+    global _task, _has_entries, _batch_full, _stopping
+    if _task is None:
+        _stopping = False
+        _has_entries, _batch_full = asyncio.Event(), asyncio.Event()
+        _task = asyncio.create_task(_run())
+    return _task
+
+
+async def stop():
+    """Drain the buffer, then stop the flusher. New entries go transactional from here on."""
+    global _task, _stopping
+    if _task is None:
+        return
+    task, _task = _task, None
+    _stopping = True
+    _has_entries.set()
+    _batch_full.set()
+    await task
+    # Sessions that recorded entries before the switch may have committed since
+    await flush()
@@ -1,26 +1,32 @@
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from dataclasses import dataclass
+import hashlib
+import secrets
+import uuid
+from sqlalchemy import delete, event, inspect
+from sqlalchemy.orm import Session, object_session
 import os
 import models
+from cache import TTLCache
+# Re-exported: the seeding scripts hash synchronously through auth
+from passwords import verify_password, get_password_hash
 
 # Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkeychangeinproduction")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+# Resolved principals are cached per token subject; the TTL bounds how long another
+# worker process can keep serving a stale role (local changes invalidate immediately).
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAXSIZE = int(os.getenv("AUTH_CACHE_MAXSIZE", "10000"))
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -31,6 +37,35 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def hash_refresh_token(token: str) -> str:
+    # Refresh tokens are 256 random bits, so a fast hash is enough (unlike passwords)
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def create_refresh_token(db, user_id: int, family_id: Optional[str] = None) -> str:
+    """
+    Add a new refresh token for user_id to the session (the caller commits) and return
+    its plaintext value. Rotations pass the family_id of the token they replace.
+    """
+    token = secrets.token_urlsafe(32)
+    db.add(models.RefreshToken(
+        token_hash=hash_refresh_token(token),
+        family_id=family_id or uuid.uuid4().hex,
+        user_id=user_id,
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+def purge_refresh_tokens(db, now: Optional[datetime] = None) -> int:
+    """
+    Delete expired refresh tokens and commit; returns how many. Revoked tokens stay
+    until they expire, so a replayed one is still recognised and revokes its family.
+    """
+    result = db.execute(
+        delete(models.RefreshToken).where(models.RefreshToken.expires_at <= (now or datetime.utcnow()))
+    )
+    db.commit()
+    return result.rowcount
+
 import logging
 
 # Configure logging
@@ -51,10 +86,59 @@ def decode_token(token: str):
         logger.info(f"DEBUG: JWTError: {e}")
         return None
 
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+@dataclass(frozen=True)
+class Principal:
+    """
+    Identity of the authenticated caller, detached from any database session so it can
+    be cached and shared between requests.
+    """
+    id: int
+    email: str
+    full_name: Optional[str]
+    role: str
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        return cls(id=user.id, email=user.email, full_name=user.full_name, role=user.role)
+
+principal_cache = TTLCache(maxsize=AUTH_CACHE_MAXSIZE, ttl=AUTH_CACHE_TTL_SECONDS)
+
+def invalidate_principal(email: str):
+    """Drop a cached principal. Needed after bulk UPDATE/DELETE statements, which skip ORM events."""
+    principal_cache.invalidate(email)
+
+def _defer_invalidation(target, *emails):
+    # Dropped at commit: dropping at flush would let a read before the commit cache the old row again
+    session = object_session(target)
+    if session is None:
+        for email in emails:
+            invalidate_principal(email)
+        return
+    session.info.setdefault("stale_principals", set()).update(emails)
+
+@event.listens_for(models.User, "after_update")
+def _invalidate_updated_user(mapper, connection, target):
+    history = inspect(target).attrs.email.history
+    _defer_invalidation(target, target.email, *(history.deleted or ()))
+
+@event.listens_for(models.User, "after_delete")
+def _invalidate_deleted_user(mapper, connection, target):
+    _defer_invalidation(target, target.email)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session):
+    for email in session.info.pop("stale_principals", ()):
+        invalidate_principal(email)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_users(session):
+    session.info.pop("stale_principals", None)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     logger.info(f"DEBUG: get_current_user called")
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -68,8 +152,28 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         raise credentials_exception
     
     logger.info(f"Token decoded: {token_data}")
-    user = db.query(models.User).filter(models.User.email == token_data["email"]).first()
+    principal = principal_cache.get(token_data["email"])
+    if principal is not None:
+        db.info["caller"] = principal.id
+        return principal
+
+    result = await db.execute(select(models.User).where(models.User.email == token_data["email"]))
+    user = result.scalars().first()
     if user is None:
         logger.info(f"User not found for email: {token_data['email']}")
         raise credentials_exception
-    return user
+    principal = Principal.from_user(user)
+    principal_cache.set(principal.email, principal)
+    # Lets the session keep this caller's reads on the primary right after they write
+    db.info["caller"] = principal.id
+    return principal
+
+
+if __name__ == "__main__":
+    # Maintenance job, run from cron: python auth.py
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        print(f"Purged {purge_refresh_tokens(db)} expired refresh tokens")
+    finally:
+        db.close()
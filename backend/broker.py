@@ -0,0 +1,178 @@
+"""
+Publish/subscribe of small string messages on named channels (e.g. "ticket:42").
+
+COMMENT_BROKER selects the transport:
+- "memory" (default): fan-out inside this process; enough for a single worker.
+- "postgres": Postgres LISTEN/NOTIFY on one dedicated asyncpg connection per
+  process, so every worker of every node sees every message.
+
+Subscribers get a bounded asyncio.Queue. A subscriber that falls more than
+BROKER_QUEUE_SIZE messages behind is cut off (its queue yields None) instead of
+growing without bound; SSE clients then reconnect and replay from Last-Event-ID.
+When the Postgres connection drops, every subscriber is cut off the same way (messages
+may have been missed) and the broker reconnects in the background. Publishing
+fails while it is down; callers publishing after a commit log that and carry on.
+"""
+import abc
+import asyncio
+import json
+import logging
+import os
+
+import database
+
+logger = logging.getLogger(__name__)
+
+COMMENT_BROKER = os.getenv("COMMENT_BROKER", "memory")
+BROKER_QUEUE_SIZE = int(os.getenv("BROKER_QUEUE_SIZE", "100"))
+BROKER_RECONNECT_MAX_SECONDS = float(os.getenv("BROKER_RECONNECT_MAX_SECONDS", "30"))
+# NOTIFY payloads are limited to 8000 bytes; leave room for the channel name
+MAX_PAYLOAD = 7900
+
+
+class Broker(abc.ABC):
+    """Local fan-out shared by both transports. Only used from the event loop thread."""
+
+    def __init__(self):
+        self._subscribers = {}
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def subscribe(self, channel: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=BROKER_QUEUE_SIZE)
+        self._subscribers.setdefault(channel, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, channel: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(channel)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[channel]
+
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def _cut_off(self, channel: str, queue: asyncio.Queue):
+        # Drop what it has not read and tell it to reconnect
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+        self.unsubscribe(channel, queue)
+
+    def _cut_off_all(self):
+        for channel, queues in list(self._subscribers.items()):
+            for queue in list(queues):
+                self._cut_off(channel, queue)
+
+    def _deliver(self, channel: str, payload: str):
+        for queue in list(self._subscribers.get(channel, ())):
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                self._cut_off(channel, queue)  # too slow
+
+    @abc.abstractmethod
+    async def publish(self, channel: str, payload: str):
+        """Deliver `payload` to every subscriber of `channel`."""
+
+
+class InProcessBroker(Broker):
+    async def publish(self, channel: str, payload: str):
+        self._deliver(channel, payload)
+
+
+class PostgresBroker(Broker):
+    """Every message travels through NOTIFY on PG_CHANNEL, including this process's own."""
+
+    PG_CHANNEL = "helpdesk_events"
+
+    def __init__(self, dsn: str):
+        super().__init__()
+        self.dsn = dsn
+        self._conn = None
+        self._lock = asyncio.Lock()
+        self._reconnect = None
+        self._stopping = False
+
+    async def start(self):
+        self._stopping = False
+        await self._connect()
+
+    async def stop(self):
+        self._stopping = True
+        if self._reconnect is not None:
+            self._reconnect.cancel()
+            self._reconnect = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    async def _connect(self):
+        import asyncpg
+        conn = await asyncpg.connect(self.dsn)
+        conn.add_termination_listener(self._on_lost)
+        await conn.add_listener(self.PG_CHANNEL, self._on_notify)
+        self._conn = conn
+
+    def _on_lost(self, connection):
+        if self._stopping or connection is not self._conn:
+            return
+        logger.warning("Broker connection lost, reconnecting")
+        self._conn = None
+        # NOTIFYs sent until we are back are lost: subscribers reconnect and replay
+        self._cut_off_all()
+        if self._reconnect is None:
+            self._reconnect = asyncio.get_running_loop().create_task(self._reconnect_loop())
+
+    async def _reconnect_loop(self):
+        delay = 0.5
+        try:
+            while self._conn is None and not self._stopping:
+                await asyncio.sleep(delay)
+                try:
+                    await self._connect()
+                except Exception as error:
+                    logger.warning("Broker reconnection failed (%s), retrying in %.0f s", error, delay)
+                    delay = min(delay * 2, BROKER_RECONNECT_MAX_SECONDS)
+        finally:
+            self._reconnect = None
+
+    def _on_notify(self, connection, pid, pg_channel, message):
+        try:
+            channel, payload = json.loads(message)
+        except (ValueError, TypeError):
+            logger.warning("Ignoring malformed broker message: %.200s", message)
+            return
+        self._deliver(channel, payload)
+
+    async def publish(self, channel: str, payload: str):
+        # One connection, one query at a time
+        async with self._lock:
+            conn = self._conn
+            if conn is None:
+                raise ConnectionError("broker connection is down")
+            try:
+                await conn.execute("SELECT pg_notify($1, $2)", self.PG_CHANNEL, json.dumps([channel, payload]))
+            except Exception:
+                if conn.is_closed():
+                    self._on_lost(conn)
+                raise
+
+
+def _plain_postgres_dsn(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    return "postgresql://" + rest
+
+
+def create_broker() -> Broker:
+    if COMMENT_BROKER == "postgres":
+        return PostgresBroker(_plain_postgres_dsn(database.DATABASE_URL))
+    return InProcessBroker()
+
+
+broker = create_broker()
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache whose entries also expire after `ttl` seconds.
+    A ttl or maxsize of 0 disables caching (every lookup is a miss).
+
+    With `maxbytes`, entries are also evicted once the sum of `sizeof(value)` goes
+    over it; a single value larger than maxbytes is not cached at all.
+
+    Values for which `is_placeholder(value)` is true (tombstones) are never returned:
+    get() counts them as misses, they only matter to set(..., unless=...).
+    """
+
+    def __init__(self, maxsize: int, ttl: float, clock=time.monotonic, maxbytes: int = None, sizeof=len,
+                 is_placeholder=None):
+        self.maxsize = maxsize
+        self._is_placeholder = is_placeholder
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self._sizeof = sizeof
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at, _ = entry
+                if expires_at > self._clock():
+                    if self._is_placeholder is not None and self._is_placeholder(value):
+                        self.misses += 1
+                        return None
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._discard(key)
+            self.misses += 1
+            return None
+
+    def set(self, key, value, unless=None):
+        """Cache `value`; with `unless`, a live entry for which unless(entry) is true is kept instead."""
+        if not self.enabled:
+            return
+        size = self._sizeof(value) if self.maxbytes is not None else 0
+        with self._lock:
+            current = self._data.get(key)
+            if unless is not None and current is not None and current[1] > self._clock() and unless(current[0]):
+                return
+            self._discard(key)
+            if self.maxbytes is not None and size > self.maxbytes:
+                return
+            self._data[key] = (value, self._clock() + self.ttl, size)
+            self.bytes += size
+            while len(self._data) > self.maxsize or (self.maxbytes is not None and self.bytes > self.maxbytes):
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def _discard(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def invalidate(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+            if self.maxbytes is not None:
+                stats.update(bytes=self.bytes, maxbytes=self.maxbytes)
+            return stats
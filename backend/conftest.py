@@ -0,0 +1,128 @@
+import contextlib
+import os
+import tempfile
+
+import pytest
+
+# Point the app at a throwaway SQLite database before main/database are imported.
+# Set TEST_DATABASE_URL to run the suite against a local Postgres instead.
+_test_db_dir = tempfile.mkdtemp(prefix="helpdesk-tests-")
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL", f"sqlite:///{_test_db_dir}/test.db")
+# Query-count assertions measure the cold path; tests exercising the cache enable it.
+os.environ.setdefault("AUTH_CACHE_TTL_SECONDS", "0")
+os.environ.setdefault("TICKET_CACHE_TTL_SECONDS", "0")
+# Any request opening a second session fails with MultipleSessionsError
+os.environ["DB_STRICT_SINGLE_SESSION"] = "1"
+
+# Manual debugging script, not a test module: it writes to the database on import.
+collect_ignore = ["test_audit_entry.py"]
+
+
+@pytest.fixture(scope="session")
+def app():
+    from main import app
+    return app
+
+
+@pytest.fixture
+def client(app):
+    from fastapi.testclient import TestClient
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+    # /token and /register are limited per client IP, and every test client shares one
+    from routers import auth as auth_router
+    auth_router.limiter.reset()
+    yield
+
+
+@pytest.fixture
+def db():
+    import database
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def _auth_headers(db, email):
+    import auth, models
+    user = db.query(models.User).filter(models.User.email == email).first()
+    token = auth.create_access_token({"sub": user.email, "role": user.role})
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def admin_headers(app, db):
+    return _auth_headers(db, "admin@helpdesk.com")
+
+
+@pytest.fixture
+def student_headers(app, db):
+    return _auth_headers(db, "student@helpdesk.com")
+
+
+@pytest.fixture
+def clean_tickets(app, db):
+    import models
+    db.query(models.Comment).delete()
+    db.query(models.Ticket).delete()
+    db.query(models.TicketCounter).delete()
+    db.commit()
+    yield
+
+
+@pytest.fixture
+def clean_audit(app, db):
+    import models
+    db.query(models.AuditLog).delete()
+    db.commit()
+    yield
+
+
+@contextlib.contextmanager
+def count_queries():
+    """Collect every SQL statement sent to the engine inside the block."""
+    import database
+    from sqlalchemy import event
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = database.async_engine.sync_engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@contextlib.contextmanager
+def query_budget(limit: int):
+    """
+    Fail when the block sends more than `limit` SQL statements: declare a route's
+    budget in its test and an N+1 regression (a query per row) breaks it.
+    """
+    with count_queries() as statements:
+        yield statements
+    assert len(statements) <= limit, (
+        f"{len(statements)} queries for a budget of {limit}:\n" + "\n".join(statements)
+    )
+
+
+def seed_commented_tickets(db, count, owner_email="student@helpdesk.com"):
+    """Insert `count` tickets owned by `owner_email`, each with two comments."""
+    import models
+    owner = db.query(models.User).filter(models.User.email == owner_email).first()
+    for i in range(count):
+        ticket = models.Ticket(title=f"T{i}", description="d", category=owner.role, owner_id=owner.id)
+        ticket.comments = [models.Comment(content="c1", author_id=owner.id),
+                           models.Comment(content="c2", author_id=owner.id)]
+        db.add(ticket)
+    db.commit()
@@ -2,6 +2,7 @@ from database import SessionLocal
 import models
 from auth import get_password_hash
 import random
+import ticket_stats
 
 def create_users_and_assign_tickets():
     db = SessionLocal()
@@ -66,6 +67,9 @@ def create_users_and_assign_tickets():
                 print(f"Assigning Ticket '{ticket.title}' (Category: {ticket.category}) -> {target_user.full_name} ({target_user.role})")
             
         db.commit()
+        if orphaned_tickets:
+            # Owners changed outside the API: recompute the dashboard counters
+            ticket_stats.rebuild(db)
         print("\nAll tickets have been assigned!")
 
     except Exception as e:
@@ -1,18 +1,277 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from fastapi import Request
+from metrics import Histogram, registry
+import itertools
 import os
+import time
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432/helpdesk")
+# Fail any request that opens more than one session (enabled by the test suite)
+DB_STRICT_SINGLE_SESSION = os.getenv("DB_STRICT_SINGLE_SESSION", "0") == "1"
 
-engine = create_engine(DATABASE_URL)
+# Async drivers used by the request path for each sync URL scheme
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def to_async_url(url: str) -> str:
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if parsed.get_driver_name() in ("asyncpg", "aiosqlite") or backend not in _ASYNC_DRIVERS:
+        return url
+    return parsed.set(drivername=_ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+
+# Optional read replicas (comma-separated URLs) for GET/HEAD requests
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# After a caller writes, their reads stay on the primary this long (read-your-writes
+# despite replication lag). Tracked per worker process.
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+
+# Connection pool (per process). Requests hold a connection only for the life of their
+# session, so DB_POOL_SIZE + DB_MAX_OVERFLOW bounds concurrent database work per worker.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))        # seconds waiting for a connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))        # seconds; beats server/proxy idle timeouts
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))  # 0 disables (Postgres only)
+
+class PoolMetrics:
+    """Checkout counters and wait-time histogram of one request-path pool (primary or replica)."""
+
+    def __init__(self):
+        self.wait_seconds = Histogram()
+        self.checkouts = 0
+        self.timeouts = 0
+
+    @staticmethod
+    def live(pool) -> dict:
+        return {
+            "pool_class": type(pool).__name__,
+            "size": pool.size() if hasattr(pool, "size") else None,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "checked_in": pool.checkedin() if hasattr(pool, "checkedin") else None,
+            "overflow": max(pool.overflow(), 0) if hasattr(pool, "overflow") else None,
+        }
+
+    def snapshot(self, pool) -> dict:
+        return {
+            **self.live(pool),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "timeout_seconds": DB_POOL_TIMEOUT,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds": self.wait_seconds.snapshot(),
+        }
+
+pool_metrics = PoolMetrics()
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """Queue pool that times every checkout, including the wait for a free connection."""
+
+    metrics = pool_metrics
+
+    @classmethod
+    def recording_to(cls, metrics: PoolMetrics):
+        # A class attribute, so the pool that engine.dispose() recreates keeps reporting there
+        return type(cls.__name__, (cls,), {"metrics": metrics})
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        finally:
+            self.metrics.wait_seconds.observe(time.perf_counter() - start)
+        self.metrics.checkouts += 1
+        return connection
+
+def _engine_options(url: str, is_async: bool, metrics: PoolMetrics = None) -> dict:
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return {}  # in-memory SQLite needs its single shared connection (StaticPool)
+
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if is_async:
+        options["poolclass"] = InstrumentedAsyncPool.recording_to(metrics) if metrics else InstrumentedAsyncPool
+    if backend == "postgresql" and DB_STATEMENT_TIMEOUT_MS:
+        if is_async:
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+# Sync engine: table creation, seeding and maintenance scripts
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL, is_async=False))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def ensure_indexes(engine, table):
+    """Create the table's declared indexes that an existing database lacks (create_all skips existing tables). Idempotent."""
+    with engine.begin() as conn:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+# Async engine: every HTTP request. Handlers await the database instead of blocking
+# the event loop or a threadpool slot for each round trip.
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL, is_async=True))
+
+replica_engines = []
+_replica_cycle = None
+
+def configure_replicas(urls):
+    """(Re)build the read replica engines; an empty list sends everything to the primary."""
+    global replica_engines, _replica_cycle
+    # Each replica counts its own checkouts; pool_metrics stays the primary's alone
+    replica_engines = [
+        create_async_engine(to_async_url(url), **_engine_options(to_async_url(url), is_async=True, metrics=PoolMetrics()))
+        for url in urls
+    ]
+    _replica_cycle = itertools.cycle(replica_engines) if replica_engines else None
+
+configure_replicas(DATABASE_REPLICA_URLS)
+
+# caller id -> time.monotonic() deadline until which their reads go to the primary
+_recent_writers = {}
+
+def _mark_write(caller):
+    now = time.monotonic()
+    if len(_recent_writers) > 10000:
+        for key in [key for key, deadline in _recent_writers.items() if deadline <= now]:
+            del _recent_writers[key]
+    _recent_writers[caller] = now + REPLICA_STICKY_SECONDS
+
+def _is_sticky(caller) -> bool:
+    deadline = _recent_writers.get(caller)
+    return deadline is not None and deadline > time.monotonic()
+
+class RoutingSession(Session):
+    """
+    Sends read-only sessions (GET/HEAD requests, see get_db) to a replica, everything
+    else to the primary. A session sticks to the replica it first picked so a request
+    reads one consistent snapshot; callers who wrote recently read from the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if (
+            not replica_engines
+            or self._flushing
+            or not self.info.get("read_only")
+            or _is_sticky(self.info.get("caller"))
+        ):
+            return async_engine.sync_engine
+        replica = self.info.get("replica")
+        if replica is None:
+            replica = self.info["replica"] = next(_replica_cycle)
+        return replica.sync_engine
+
+@event.listens_for(RoutingSession, "after_flush")
+def _note_flush(session, flush_context):
+    session.info["wrote"] = True
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _note_bulk_write(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info["wrote"] = True
+
+@event.listens_for(RoutingSession, "after_commit")
+def _stick_to_primary(session):
+    caller = session.info.get("caller")
+    if session.info.pop("wrote", False) and caller is not None:
+        _mark_write(caller)
+
+# expire_on_commit=False: attributes stay readable after commit without an implicit
+# (and, under asyncio, forbidden) lazy refresh
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    sync_session_class=RoutingSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+def _live_pool(key):
+    return lambda: PoolMetrics.live(async_engine.sync_engine.pool)[key] or 0
+
+registry.gauge("helpdesk_db_pool_checked_out", "Connections in use", fn=_live_pool("checked_out")).labels()
+registry.gauge("helpdesk_db_pool_checked_in", "Idle connections in the pool", fn=_live_pool("checked_in")).labels()
+registry.gauge("helpdesk_db_pool_size", "Configured pool size", fn=_live_pool("size")).labels()
+registry.gauge("helpdesk_db_pool_overflow", "Connections open beyond the pool size", fn=_live_pool("overflow")).labels()
+registry.counter("helpdesk_db_pool_checkouts_total", "Connection checkouts", fn=lambda: pool_metrics.checkouts).labels()
+registry.counter("helpdesk_db_pool_timeouts_total", "Checkouts that gave up waiting", fn=lambda: pool_metrics.timeouts).labels()
+registry.histogram("helpdesk_db_pool_wait_seconds", "Time to check out a connection").set_child(pool_metrics.wait_seconds)
+
+def _pool_snapshot(pool) -> dict:
+    metrics = getattr(pool, "metrics", None)
+    return metrics.snapshot(pool) if metrics is not None else PoolMetrics.live(pool)
+
+def pool_status() -> dict:
+    status = pool_metrics.snapshot(async_engine.sync_engine.pool)
+    status["replicas"] = [_pool_snapshot(replica.sync_engine.pool) for replica in replica_engines]
+    return status
+
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db(request: Request):
+    """
+    Request-scoped unit of work. Auth and every route depend on this same callable,
+    so FastAPI resolves it once per request and they all share one session. GET and
+    HEAD requests may read from a replica (see RoutingSession); auth records the
+    caller in db.info for read-your-writes stickiness.
+    """
+    async with AsyncSessionLocal() as db:
+        db.info["read_only"] = request.method in ("GET", "HEAD")
         yield db
+
+@asynccontextmanager
+async def streaming_session(caller=None):
+    """
+    Read-only session for a response body streamed after the handler returns. FastAPI
+    closes get_db before the body is sent, so the stream needs its own session; it
+    runs in a fresh request scope since it never overlaps the request's session.
+    """
+    with request_scope():
+        async with AsyncSessionLocal() as db:
+            db.info.update(read_only=True, caller=caller)
+            yield db
+
+class MultipleSessionsError(RuntimeError):
+    pass
+
+# Sessions that began a transaction during the current request (see request_scope)
+_request_sessions: ContextVar = ContextVar("request_sessions", default=None)
+
+@contextmanager
+def request_scope():
+    token = _request_sessions.set(set())
+    try:
+        yield
     finally:
-        db.close()
+        _request_sessions.reset(token)
+
+# Registered on the base Session class so it also sees the sync sessions behind AsyncSession
+@event.listens_for(Session, "after_begin")
+def _track_request_session(session, transaction, connection):
+    sessions = _request_sessions.get()
+    if sessions is None:
+        return
+    sessions.add(session.hash_key)
+    if DB_STRICT_SINGLE_SESSION and len(sessions) > 1:
+        raise MultipleSessionsError("request opened a second database session; depend on database.get_db")
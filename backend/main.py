@@ -1,10 +1,19 @@
-from fastapi import FastAPI, Depends, HTTPException, Request, status
-from sqlalchemy.orm import Session
-from typing import List
-import models, schemas, database, auth
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Union
+from datetime import datetime
+import models, schemas, database, auth, passwords, search, ticket_stats, audit_sink, audit_archive, export, etags, ticket_cache
+from broker import broker
+from middleware import MetricsMiddleware, RequestScopeMiddleware, route_label
+from metrics import registry
+from pagination import keyset_page, page_results
 from routers import auth as auth_router
 from routers import comments as comments_router
 from routers import audit as audit_router
+from routers import admin as admin_router
 from routers.audit import log_action
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
@@ -12,6 +21,15 @@ from slowapi.errors import RateLimitExceeded
 
 # Create tables
 models.Base.metadata.create_all(bind=database.engine)
+# Index ajoutés après coup : create_all ne touche pas aux tables existantes
+database.ensure_indexes(database.engine, models.Ticket.__table__)
+database.ensure_indexes(database.engine, models.Comment.__table__)
+database.ensure_indexes(database.engine, models.RefreshToken.__table__)
+search.install(database.engine)
+etags.install(database.engine)
+audit_archive.install(database.engine)
+# Sur PostgreSQL, le partitionnement recrée déjà ces index ; ailleurs, seul ceci les ajoute
+database.ensure_indexes(database.engine, models.AuditLog.__table__)
 
 # Automate Seeding (Create initial users if they don't exist)
 try:
@@ -23,6 +41,10 @@ try:
     create_user()
     create_admin()
     create_users_and_assign_tickets()
+    ticket_stats.rebuild_if_empty()
+    # Jetons de rafraîchissement expirés (en continu : python auth.py depuis cron)
+    with database.SessionLocal() as db:
+        auth.purge_refresh_tokens(db)
     print("--- Auto-Seeding Complete ---")
 except Exception as e:
     print(f"Auto-Seeding Warning: {e}")
@@ -30,98 +52,356 @@ except Exception as e:
 # Rate limiting configuration
 limiter = Limiter(key_func=get_remote_address, default_limits=["100/minute"])
 
-app = FastAPI(title="Help Desk API", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    passwords.start_pool()
+    audit_sink.start()
+    audit_archive.start()
+    await broker.start()
+    ticket_cache.start()
+    yield
+    await ticket_cache.stop()
+    await broker.stop()
+    await audit_archive.stop()
+    await audit_sink.stop()
+    passwords.shutdown_pool()
+    await database.async_engine.dispose()
+    for replica in database.replica_engines:
+        await replica.dispose()
+
+app = FastAPI(title="Help Desk API", version="0.1.0", lifespan=lifespan)
 app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+
+rate_limited = registry.counter("helpdesk_rate_limited_total", "Requests rejected by slowapi", ["route"])
+
+def rate_limit_exceeded(request: Request, exc: RateLimitExceeded):
+    rate_limited.labels(route_label(request.scope)).inc()
+    return _rate_limit_exceeded_handler(request, exc)
+
+app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded)
+app.add_middleware(RequestScopeMiddleware)
+# Ajouté en dernier : enveloppe toute la pile, latence complète comprise
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth_router.router)
 app.include_router(comments_router.router)
 app.include_router(audit_router.router)
+app.include_router(admin_router.router)
 
-# Dependency
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+async def load_ticket(db: AsyncSession, ticket_id: int):
+    # Recharge le ticket avec owner et comments en requêtes groupées (pas de lazy load
+    # pendant la sérialisation) ; populate_existing rafraîchit un objet déjà en session.
+    result = await db.execute(
+        select(models.Ticket)
+        .options(*models.TICKET_LOAD_OPTIONS)
+        .where(models.Ticket.id == ticket_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalar_one_or_none()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # Format texte Prometheus ; à ne pas exposer publiquement (scrape réseau interne)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Welcome to Help Desk API with PostgreSQL"}
 
-@app.get("/me", response_model=schemas.User)
-def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
+@app.get("/me", response_model=schemas.UserProfile)
+async def read_users_me(current_user: auth.Principal = Depends(auth.get_current_user)):
+    # Profil compact : appelé à chaque chargement de page, il ne doit pas dépendre
+    # de l'historique de l'utilisateur. Ses tickets sont sur /me/tickets.
     return current_user
 
-@app.get("/tickets", response_model=List[schemas.Ticket])
-def get_tickets(skip: int = 0, limit: int = 100, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    # Admin voit tous les tickets
+@app.get("/me/tickets", response_model=Union[List[schemas.TicketSummary], schemas.TicketSummaryPage])
+async def read_my_tickets(
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    stmt = ticket_summary_query().where(models.Ticket.owner_id == current_user.id)
+    return await list_tickets(db, stmt, skip, limit, cursor)
+
+class TicketFilters:
+    """
+    Query parameters shared by the ticket listing endpoints, applied as SQL predicates
+    (backed by the composite indexes on Ticket) rather than in the browser.
+    """
+    def __init__(
+        self,
+        status: Optional[str] = None,
+        priority: Optional[str] = None,
+        category: Optional[str] = None,
+        owner_role: Optional[str] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+    ):
+        self.status = status
+        self.priority = priority
+        self.category = category
+        self.owner_role = owner_role
+        self.created_after = created_after
+        self.created_before = created_before
+
+    def apply(self, stmt, current_user: auth.Principal):
+        # Utilisateur normal voit seulement ses tickets, l'admin voit tout
+        if current_user.role != "admin":
+            stmt = stmt.where(models.Ticket.owner_id == current_user.id)
+        if self.status is not None:
+            stmt = stmt.where(models.Ticket.status == self.status)
+        if self.priority is not None:
+            stmt = stmt.where(models.Ticket.priority == self.priority)
+        if self.category is not None:
+            stmt = stmt.where(models.Ticket.category == self.category)
+        if self.owner_role is not None:
+            stmt = stmt.join(models.Ticket.owner).where(models.User.role == self.owner_role)
+        if self.created_after is not None:
+            stmt = stmt.where(models.Ticket.created_at >= self.created_after)
+        if self.created_before is not None:
+            stmt = stmt.where(models.Ticket.created_at < self.created_before)
+        return stmt
+
+async def ticket_filters(
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    category: Optional[str] = None,
+    owner_role: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+) -> TicketFilters:
+    # Dépendance async : une classe (sync) passerait par le threadpool à chaque liste
+    return TicketFilters(status, priority, category, owner_role, created_after, created_before)
+
+def ticket_summary_query():
+    # Projection légère pour les listes : pas de description, d'owner ni de fil de
+    # commentaires, seulement leur nombre calculé en SQL. Le détail reste sur /tickets/{id}.
+    comment_count = (
+        select(func.count(models.Comment.id))
+        .where(models.Comment.ticket_id == models.Ticket.id)
+        .correlate(models.Ticket)
+        .scalar_subquery()
+        .label("comment_count")
+    )
+    return select(
+        models.Ticket.id,
+        models.Ticket.title,
+        models.Ticket.status,
+        models.Ticket.priority,
+        models.Ticket.category,
+        models.Ticket.created_at,
+        models.Ticket.owner_id,
+        comment_count,
+    )
+
+async def list_tickets(db: AsyncSession, stmt, skip: int, limit: int, cursor: Optional[str], entities: bool = False):
+    """
+    Run a ticket listing statement in offset or cursor mode. entities=True when the
+    statement selects Ticket objects rather than a column projection.
+    """
+    def fetch(result):
+        return result.scalars().all() if entities else result.all()
+
+    # Mode curseur (keyset) : passer cursor= (vide) pour la première page,
+    # puis le next_cursor renvoyé. Latence constante quelle que soit la profondeur.
+    if cursor is not None:
+        columns = (models.Ticket.created_at, models.Ticket.id)
+        stmt = keyset_page(stmt, columns, cursor, limit, (datetime.fromisoformat, int))
+        items, next_cursor = page_results(fetch(await db.execute(stmt)), columns, limit)
+        return {"items": items, "next_cursor": next_cursor}
+
+    # Ancien mode skip/limit, conservé pour les clients existants
+    return fetch(await db.execute(stmt.offset(skip).limit(limit)))
+
+async def ticket_list_etag(db: AsyncSession, request: Request, current_user: auth.Principal, kind: str):
+    # Toute écriture avance la version de liste (globale pour l'admin, par propriétaire
+    # sinon) : une lecture par clé primaire, quelle que soit la taille de la liste ou la page
+    scope = etags.GLOBAL_SCOPE if current_user.role == "admin" else current_user.id
+    version = await etags.list_version(db, scope)
+    return etags.make_etag(kind, scope, version, *etags.request_key(request, current_user))
+
+@app.get("/tickets", response_model=Union[List[schemas.Ticket], schemas.TicketPage])
+async def get_tickets(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    filters: TicketFilters = Depends(ticket_filters),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    etag = await ticket_list_etag(db, request, current_user, "tickets")
+    if etags.not_modified(request, etag):
+        return etags.not_modified_response(etag)
+    etags.set_etag(response, etag)
+    stmt = select(models.Ticket).options(*models.TICKET_LOAD_OPTIONS)
+    return await list_tickets(db, filters.apply(stmt, current_user), skip, limit, cursor, entities=True)
+
+@app.get("/tickets/summary", response_model=Union[List[schemas.TicketSummary], schemas.TicketSummaryPage])
+async def get_ticket_summaries(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    filters: TicketFilters = Depends(ticket_filters),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    etag = await ticket_list_etag(db, request, current_user, "summary")
+    if etags.not_modified(request, etag):
+        return etags.not_modified_response(etag)
+    etags.set_etag(response, etag)
+    stmt = ticket_summary_query()
+    return await list_tickets(db, filters.apply(stmt, current_user), skip, limit, cursor)
+
+@app.get("/tickets/search", response_model=schemas.TicketSearchPage)
+async def search_tickets(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    dialect = db.bind.dialect.name
+    if not search.is_supported(dialect):
+        raise HTTPException(status_code=501, detail="Search is not available on this database")
+    if not q.strip():
+        return {"items": [], "next_cursor": None}
+
+    ranked = search.ranked_ticket_ids(dialect, q)
+    stmt = ticket_summary_query().add_columns(ranked.c.rank).join(ranked, ranked.c.id == models.Ticket.id)
+    # Même visibilité que get_tickets
+    if current_user.role != "admin":
+        stmt = stmt.where(models.Ticket.owner_id == current_user.id)
+
+    # Pagination par curseur sur (pertinence, id)
+    columns = (ranked.c.rank, models.Ticket.id)
+    stmt = keyset_page(stmt, columns, cursor, limit, (float, int))
+    items, next_cursor = page_results((await db.execute(stmt)).all(), columns, limit)
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.get("/tickets/stats", response_model=schemas.TicketStats)
+async def get_ticket_stats(current_user: auth.Principal = Depends(auth.get_current_user), db: AsyncSession = Depends(database.get_db)):
+    # Compteurs maintenus à chaque écriture : pas de COUNT(*) sur la table tickets
     if current_user.role == "admin":
-        tickets = db.query(models.Ticket).offset(skip).limit(limit).all()
-    else:
-        # Utilisateur normal voit seulement ses tickets
-        tickets = db.query(models.Ticket).filter(models.Ticket.owner_id == current_user.id).offset(skip).limit(limit).all()
-    return tickets
+        return await ticket_stats.read_stats(db)
+    return await ticket_stats.read_stats(db, owner_id=current_user.id)
+
+@app.get("/tickets/export")
+async def export_tickets(
+    format: str = Query("csv", pattern=export.EXPORT_FORMAT_PATTERN),
+    filters: TicketFilters = Depends(ticket_filters),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    # Mêmes règles de visibilité que GET /tickets ; flux via curseur serveur
+    stmt = select(
+        models.Ticket.id,
+        models.Ticket.title,
+        models.Ticket.description,
+        models.Ticket.status,
+        models.Ticket.priority,
+        models.Ticket.category,
+        models.Ticket.owner_id,
+        models.Ticket.created_at,
+    )
+    stmt = filters.apply(stmt, current_user).order_by(models.Ticket.created_at.desc(), models.Ticket.id.desc())
+    return export.export_response(stmt, format, "tickets", caller=current_user.id)
 
 @app.post("/tickets", response_model=schemas.Ticket)
-def create_ticket(ticket: schemas.TicketCreate, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+async def create_ticket(ticket: schemas.TicketCreate, current_user: auth.Principal = Depends(auth.get_current_user), db: AsyncSession = Depends(database.get_db)):
     db_ticket = models.Ticket(**ticket.model_dump(), owner_id=current_user.id)
     db.add(db_ticket)
-    db.commit()
-    db.refresh(db_ticket)
+    await ticket_stats.record_created(db, db_ticket, current_user.role)
+    await etags.bump_list_versions(db, current_user.id)
+    await db.flush()
     
-    # Audit Log
+    # Audit Log : écrit avec le commit du ticket, pas dans une seconde transaction
     log_action(db, current_user.id, "CREATE_TICKET", "ticket", db_ticket.id, f"Created ticket: {db_ticket.title}")
+    await db.commit()
     
-    return db_ticket
+    return await load_ticket(db, db_ticket.id)
 
 @app.get("/tickets/{ticket_id}", response_model=schemas.Ticket)
-def read_ticket(ticket_id: int, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    db_ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
-    if db_ticket is None:
-        raise HTTPException(status_code=404, detail="Ticket not found")
+async def read_ticket(ticket_id: int, request: Request, current_user: auth.Principal = Depends(auth.get_current_user), db: AsyncSession = Depends(database.get_db)):
+    cached = ticket_cache.lookup(ticket_id)
+    if cached is None:
+        # Le cache ne se remplit que depuis le primaire : une réplique en retard y
+        # installerait une version périmée pour tous, auteur de l'écriture compris
+        db.info["read_only"] = False
+        # Lecture de la seule version par clé primaire : 304 sans charger ni sérialiser le ticket
+        row = (await db.execute(
+            select(models.Ticket.owner_id, models.Ticket.version).where(models.Ticket.id == ticket_id)
+        )).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Ticket not found")
+        owner_id, version = row.owner_id, row.version
+    else:
+        owner_id, version = cached.owner_id, cached.version
     
-    # Vérifier que l'utilisateur peut voir ce ticket
-    if current_user.role != "admin" and db_ticket.owner_id != current_user.id:
+    # Vérifier que l'utilisateur peut voir ce ticket (aussi sur un ticket en cache)
+    if current_user.role != "admin" and owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to view this ticket")
     
-    return db_ticket
+    etag = etags.make_etag("ticket", ticket_id, version)
+    if etags.not_modified(request, etag):
+        return etags.not_modified_response(etag)
+    if cached is None:
+        ticket = await load_ticket(db, ticket_id)
+        if ticket is None:
+            # Supprimé entre la lecture de la version et le chargement
+            raise HTTPException(status_code=404, detail="Ticket not found")
+        cached = ticket_cache.store(ticket)
+    response = Response(content=cached.payload, media_type="application/json")
+    etags.set_etag(response, etag)
+    return response
 
 @app.patch("/tickets/{ticket_id}", response_model=schemas.Ticket)
-def update_ticket_status(ticket_id: int, status: str, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+async def update_ticket_status(ticket_id: int, status: str, current_user: auth.Principal = Depends(auth.get_current_user), db: AsyncSession = Depends(database.get_db)):
     # Seul l'admin peut modifier les tickets
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Only admins can update tickets")
     
-    db_ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
+    db_ticket = await db.get(models.Ticket, ticket_id)
     if db_ticket is None:
         raise HTTPException(status_code=404, detail="Ticket not found")
     
     old_status = db_ticket.status
     db_ticket.status = status
-    db.commit()
-    db.refresh(db_ticket)
+    await ticket_stats.record_status_change(db, db_ticket, old_status)
+    await etags.bump_version(db, ticket_id, db_ticket.owner_id)
     
     # Audit Log
     log_action(db, current_user.id, "UPDATE_STATUS", "ticket", ticket_id, f"Status changed from {old_status} to {status}")
+    await db.commit()
     
+    # Cache en écriture directe : le ticket rechargé remplace l'entrée
+    db_ticket = await load_ticket(db, ticket_id)
+    ticket_cache.store(db_ticket)
+    await ticket_cache.invalidate(ticket_id, db_ticket.version, keep_local=True)
     return db_ticket
 
 @app.delete("/tickets/{ticket_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_ticket(ticket_id: int, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+async def delete_ticket(ticket_id: int, current_user: auth.Principal = Depends(auth.get_current_user), db: AsyncSession = Depends(database.get_db)):
     # Seul l'admin peut supprimer les tickets
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Only admins can delete tickets")
     
-    db_ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
+    # owner et comments chargés d'avance : pas de lazy load possible en asyncio
+    db_ticket = await load_ticket(db, ticket_id)
     if db_ticket is None:
         raise HTTPException(status_code=404, detail="Ticket not found")
     
-    db.delete(db_ticket)
-    db.commit()
+    await ticket_stats.record_deleted(db, db_ticket, db_ticket.owner.role if db_ticket.owner else None)
+    await etags.bump_list_versions(db, db_ticket.owner_id)
+    await db.delete(db_ticket)
     
     # Audit Log
     log_action(db, current_user.id, "DELETE_TICKET", "ticket", ticket_id, "Ticket deleted")
+    await db.commit()
+    await ticket_cache.invalidate(ticket_id, ticket_cache.DELETED)
     
     return None
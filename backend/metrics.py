@@ -0,0 +1,136 @@
+"""
+Minimal in-process metric primitives and their Prometheus text rendering.
+
+Updated from the event loop thread only (every request handler and the async engine's
+pool run there), so plain integer arithmetic is safe without locks and the hot path
+never waits on one. Values that already live elsewhere (pool size, queue depth) are
+registered as callbacks and read at scrape time instead of being mirrored.
+"""
+import bisect
+
+# Seconds; tuned for connection-pool waits and request latencies
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """[(upper_bound, cumulative_count), ...] ending with (inf, count)."""
+        total, out = 0, []
+        for bound, count in zip(self.buckets + (float("inf"),), self._counts):
+            total += count
+            out.append((bound, total))
+        return out
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": {("+Inf" if bound == float("inf") else str(bound)): count
+                        for bound, count in self.cumulative()},
+        }
+
+
+class Counter:
+    def __init__(self, fn=None):
+        self.value = 0
+        self._fn = fn
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def get(self):
+        return self._fn() if self._fn is not None else self.value
+
+
+class Gauge(Counter):
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class MetricFamily:
+    """One metric name; a child metric per combination of label values."""
+
+    def __init__(self, kind: str, name: str, help: str, labelnames=(), factory=None):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._factory()
+        return child
+
+    def set_child(self, metric, *values):
+        self._children[values] = metric
+        return metric
+
+    def _labels(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, child in list(self._children.items()):
+            if self.kind == "histogram":
+                for bound, count in child.cumulative():
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    yield f"{self.name}_bucket{self._labels(values, [('le', le)])} {count}"
+                yield f"{self.name}_sum{self._labels(values)} {child.sum}"
+                yield f"{self.name}_count{self._labels(values)} {child.count}"
+            else:
+                yield f"{self.name}{self._labels(values)} {child.get()}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Registry:
+    def __init__(self):
+        self._families = {}
+
+    def _family(self, kind, name, help, labelnames, factory):
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = MetricFamily(kind, name, help, labelnames, factory)
+        return family
+
+    def counter(self, name: str, help: str, labelnames=(), fn=None) -> MetricFamily:
+        return self._family("counter", name, help, labelnames, lambda: Counter(fn))
+
+    def gauge(self, name: str, help: str, labelnames=(), fn=None) -> MetricFamily:
+        return self._family("gauge", name, help, labelnames, lambda: Gauge(fn))
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> MetricFamily:
+        return self._family("histogram", name, help, labelnames, lambda: Histogram(buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format 0.0.4."""
+        lines = []
+        for family in list(self._families.values()):
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
@@ -0,0 +1,84 @@
+import time
+
+import database
+import profiler
+from metrics import registry
+
+
+class RequestScopeMiddleware:
+    """
+    Pure ASGI middleware opening a per-request scope for database bookkeeping.
+    Context variables set here are inherited by the handler, its dependencies and
+    the threadpool workers they run in. It also reports the request's SQL profile
+    as a Server-Timing header (queries run before the response starts).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        with database.request_scope(), profiler.profile_request() as profile:
+            if profile is None:
+                return await self.app(scope, receive, send)
+
+            async def send_with_timing(message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", profile.server_timing().encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                profiler.log_profile(scope["method"], scope["path"], profile)
+
+
+requests_total = registry.counter(
+    "helpdesk_http_requests_total", "HTTP requests by route template and status", ["method", "route", "status"]
+)
+request_seconds = registry.histogram(
+    "helpdesk_http_request_duration_seconds", "Time until the response body is sent", ["method", "route"]
+)
+in_flight = registry.gauge("helpdesk_http_requests_in_flight", "Requests being served").labels()
+
+
+def route_label(scope) -> str:
+    """Route template (/tickets/{ticket_id}), never the raw path, to keep label cardinality bounded."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Request count, latency and in-flight gauge per route. Runs on the event loop
+    only: a few integer updates per request, no locks.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            route = route_label(scope)
+            request_seconds.labels(scope["method"], route).observe(time.perf_counter() - started)
+            requests_total.labels(scope["method"], route, status).inc()
@@ -1,6 +1,5 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum, Index, UniqueConstraint
+from sqlalchemy.orm import relationship, selectinload
 from database import Base
 import datetime
 import enum
@@ -33,6 +32,19 @@ class User(Base):
     tickets = relationship("Ticket", back_populates="owner")
     comments = relationship("Comment", back_populates="author")
 
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    token_hash = Column(String, unique=True, index=True, nullable=False)  # SHA-256, never the token itself
+    family_id = Column(String, index=True, nullable=False)                # one family per login, shared by rotations
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)            # purged once past (auth.purge_refresh_tokens)
+    revoked_at = Column(DateTime, nullable=True)
+
+    user = relationship("User")
+
 class Ticket(Base):
     __tablename__ = "tickets"
 
@@ -44,10 +56,43 @@ class Ticket(Base):
     category = Column(String)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     owner_id = Column(Integer, ForeignKey("users.id"))
+    # Bumped by every write to the ticket or its comments (etags.bump_version)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     owner = relationship("User", back_populates="tickets")
     comments = relationship("Comment", back_populates="ticket")
 
+    __table_args__ = (
+        # Backs keyset pagination on GET /tickets (ORDER BY created_at DESC, id DESC)
+        Index("ix_tickets_created_at_id", "created_at", "id"),
+        # Filtered listings: equality predicate first, then the sort key
+        Index("ix_tickets_status_created_at", "status", "created_at", "id"),
+        Index("ix_tickets_priority_created_at", "priority", "created_at", "id"),
+        Index("ix_tickets_category_created_at", "category", "created_at", "id"),
+        Index("ix_tickets_owner_id_created_at", "owner_id", "created_at", "id"),
+    )
+
+class TicketListVersion(Base):
+    """Bumped by every ticket write (etags.bump_list_versions); the list ETags are built from it."""
+    __tablename__ = "ticket_list_versions"
+
+    scope = Column(Integer, primary_key=True, autoincrement=False)  # 0 = all tickets, else owner user id
+    version = Column(Integer, nullable=False, default=0)
+
+class TicketCounter(Base):
+    __tablename__ = "ticket_counters"
+
+    id = Column(Integer, primary_key=True, index=True)
+    scope = Column(Integer, nullable=False, default=0)  # 0 = all tickets, else owner user id
+    dimension = Column(String, nullable=False)          # status, priority, category, owner_role
+    value = Column(String, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("scope", "dimension", "value", name="uq_ticket_counters_scope_dimension_value"),
+    )
+
 class Comment(Base):
     __tablename__ = "comments"
 
@@ -60,6 +105,12 @@ class Comment(Base):
     ticket = relationship("Ticket", back_populates="comments")
     author = relationship("User", back_populates="comments")
 
+    __table_args__ = (
+        # Threads are read per ticket in (created_at, id) order, see GET /tickets/{id}/comments/
+        Index("ix_comments_ticket_id_created_at", "ticket_id", "created_at", "id"),
+        Index("ix_comments_author_id", "author_id"),
+    )
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
 
@@ -72,3 +123,19 @@ class AuditLog(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
 
     user = relationship("User")
+
+    __table_args__ = (
+        # Backs keyset pagination on GET /audit/ (ORDER BY timestamp DESC, id DESC)
+        Index("ix_audit_logs_timestamp_id", "timestamp", "id"),
+        # Filtered listings: equality predicates first, then the sort key
+        Index("ix_audit_logs_user_id_timestamp", "user_id", "timestamp", "id"),
+        Index("ix_audit_logs_action_timestamp", "action", "timestamp", "id"),
+        Index("ix_audit_logs_target", "target_type", "target_id", "timestamp", "id"),
+    )
+
+# Relationships embedded by schemas.Ticket. Every route returning full tickets applies
+# these so serialization never falls back to per-row lazy loads (N+1 queries).
+TICKET_LOAD_OPTIONS = (
+    selectinload(Ticket.owner),
+    selectinload(Ticket.comments),
+)
@@ -0,0 +1,62 @@
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+
+def encode_cursor(*values) -> str:
+    """
+    Pack the sort key of the last row of a page into an opaque, URL-safe token.
+    """
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *converters) -> tuple:
+    """
+    Reverse of encode_cursor. Each converter rebuilds one value of the sort key
+    (e.g. datetime.fromisoformat, int). Raises a 400 on any malformed token.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if not isinstance(payload, list) or len(payload) != len(converters):
+            raise ValueError("cursor arity mismatch")
+        return tuple(convert(value) for convert, value in zip(converters, payload))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_page(stmt, columns, cursor, limit, converters, descending=True):
+    """
+    Keyset pagination over `columns` (which must be unique together, e.g.
+    (created_at, id)), newest first unless descending=False. Seeks past the cursor
+    with a row-value comparison so the database walks the matching index instead of
+    scanning and discarding skipped rows.
+
+    Returns the statement to execute; it fetches one extra row so page_results can
+    tell whether another page exists.
+    """
+    if cursor:
+        after = decode_cursor(cursor, *converters)
+        key = tuple_(*columns)
+        stmt = stmt.where(key < after if descending else key > after)
+    order = [column.desc() if descending else column.asc() for column in columns]
+    return stmt.order_by(*order).limit(limit + 1)
+
+
+def page_results(rows, columns, limit):
+    """
+    Trim the rows fetched by a keyset_page statement. Returns (rows, next_cursor);
+    next_cursor is None on the last page.
+    """
+    rows = list(rows)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(*[getattr(last, column.key) for column in columns])
+    return rows, next_cursor
@@ -0,0 +1,94 @@
+"""
+Argon2 password hashing, run off the request path.
+
+Each hash/verify burns tens of milliseconds of CPU. Request handlers await
+`verify_password_async` / `hash_password_async`, which run the work in a dedicated
+process pool so a burst of logins neither holds the event loop nor the threadpool
+that every other endpoint depends on. Apart from the dependency-free `metrics`
+module, it imports nothing from the app so spawned workers stay small.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+from starlette.concurrency import run_in_threadpool
+
+from metrics import registry
+
+# 0 runs hashing in the threadpool instead of a process pool (single-core containers)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+# Hash/verify jobs allowed to wait or run at once; beyond that callers get PasswordHasherBusy
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+
+_pool = None
+_pending = 0  # only touched from the event loop thread, no lock needed
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when PASSWORD_HASH_MAX_PENDING jobs are already queued."""
+
+
+def verify_password(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def get_password_hash(password):
+    return pwd_context.hash(password)
+
+
+def start_pool():
+    """Create the worker processes up front so the first login doesn't pay for it."""
+    global _pool
+    if _pool is None and PASSWORD_HASH_WORKERS > 0:
+        # spawn, not fork: the parent holds DB connections and threads
+        _pool = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+
+def pending_jobs() -> int:
+    return _pending
+
+
+hash_seconds = registry.histogram(
+    "helpdesk_password_hash_seconds", "Argon2 hash/verify time seen by the caller, queueing included", ["operation"]
+)
+registry.gauge("helpdesk_password_hash_pending", "Argon2 jobs queued or running", fn=pending_jobs).labels()
+
+
+async def _run(operation, fn, *args):
+    global _pending
+    if _pending >= PASSWORD_HASH_MAX_PENDING:
+        raise PasswordHasherBusy()
+    _pending += 1
+    started = time.perf_counter()
+    try:
+        pool = start_pool()
+        if pool is None:
+            return await run_in_threadpool(fn, *args)
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+    finally:
+        _pending -= 1
+        hash_seconds.labels(operation).observe(time.perf_counter() - started)
+
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    return await _run("verify", verify_password, plain_password, hashed_password)
+
+
+async def hash_password_async(password) -> str:
+    return await _run("hash", get_password_hash, password)
@@ -0,0 +1,96 @@
+"""
+Per-request SQL profile: query count, total database time and the slowest statement.
+
+Cursor events on every Engine feed the profile of the request running in the
+current context (opened by RequestScopeMiddleware). The middleware then reports it
+as a Server-Timing header, visible in the browser's network panel, and as a DEBUG
+log line that includes the slowest statement. Outside a request (startup, scripts,
+the audit flusher) nothing is recorded.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+SQL_PROFILE = os.getenv("SQL_PROFILE", "1") == "1"
+
+_current: ContextVar = ContextVar("sql_profile", default=None)
+
+
+class RequestProfile:
+    __slots__ = ("queries", "seconds", "slowest_seconds", "slowest_statement")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement = None
+
+    def record(self, statement: str, seconds: float):
+        self.queries += 1
+        self.seconds += seconds
+        if seconds > self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+
+    def server_timing(self) -> str:
+        return (
+            f'db;dur={self.seconds * 1000:.2f};desc="{self.queries} queries", '
+            f"db-slowest;dur={self.slowest_seconds * 1000:.2f}"
+        )
+
+
+@contextmanager
+def profile_request():
+    """Collect the SQL profile of everything run in this context. Yields the profile (None if disabled)."""
+    if not SQL_PROFILE:
+        yield None
+        return
+    profile = RequestProfile()
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+
+
+def current_profile():
+    return _current.get()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profiler_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    started = conn.info.get("profiler_started")
+    if profile is not None and started:
+        profile.record(statement, time.perf_counter() - started.pop())
+
+
+@event.listens_for(Engine, "handle_error")
+def _drop_timer(exception_context):
+    # The failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    started = connection.info.get("profiler_started") if connection is not None else None
+    if started:
+        started.pop()
+
+
+def log_profile(method: str, path: str, profile: RequestProfile):
+    if profile.queries and logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "%s %s: %d queries, %.1f ms in the database, slowest %.1f ms: %s",
+            method, path, profile.queries, profile.seconds * 1000,
+            profile.slowest_seconds * 1000, " ".join((profile.slowest_statement or "").split())[:500],
+        )
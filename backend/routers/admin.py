@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+import auth, database, ticket_cache
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"]
+)
+
+async def require_admin(current_user: auth.Principal = Depends(auth.get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
+
+@router.get("/cache-stats")
+async def get_cache_stats(current_user: auth.Principal = Depends(require_admin)):
+    return {
+        "principals": auth.principal_cache.stats(),
+        "tickets": ticket_cache.ticket_cache.stats(),
+    }
+
+@router.get("/pool")
+async def get_pool_status(current_user: auth.Principal = Depends(require_admin)):
+    # Distinguishes pool starvation (waits/timeouts) from slow queries
+    return database.pool_status()
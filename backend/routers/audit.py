@@ -1,46 +1,113 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List, Optional
-import models, schemas, database, auth
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Union
 from datetime import datetime
+import models, schemas, database, auth, audit_sink, export
+from pagination import keyset_page, page_results
 
 router = APIRouter(
     prefix="/audit",
     tags=["audit"]
 )
 
-def log_action(db: Session, user_id: int, action: str, target_type: str, target_id: int, details: str = None):
+def log_action(db: AsyncSession, user_id: int, action: str, target_type: str, target_id: int, details: str = None):
     """
-    Helper function to create an audit log entry.
+    Helper function to create an audit log entry. Call it before the business commit:
+    the entry is written with (transactional) or right after (buffered) that commit,
+    see audit_sink.
     """
-    try:
-        log_entry = models.AuditLog(
-            user_id=user_id,
-            action=action,
-            target_type=target_type,
-            target_id=target_id,
-            details=details,
-            timestamp=datetime.utcnow()
-        )
-        db.add(log_entry)
-        db.commit()
-    except Exception as e:
-        print(f"Failed to create audit log: {e}")
-        # Don't raise exception to avoid blocking the main action
-
-@router.get("/", response_model=List[schemas.AuditLogDisplay] if hasattr(schemas, "AuditLogDisplay") else List[dict])
-def get_audit_logs(
-    skip: int = 0, 
-    limit: int = 100, 
-    current_user: models.User = Depends(auth.get_current_user), 
-    db: Session = Depends(database.get_db)
+    audit_sink.record(db, user_id, action, target_type, target_id, details)
+
+class AuditFilters:
+    """
+    Query parameters of GET /audit/, applied as SQL predicates backed by the
+    composite indexes on AuditLog.
+    """
+    def __init__(
+        self,
+        action: Optional[str] = None,
+        user_id: Optional[int] = None,
+        target_type: Optional[str] = None,
+        target_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ):
+        self.action = action
+        self.user_id = user_id
+        self.target_type = target_type
+        self.target_id = target_id
+        self.since = since
+        self.until = until
+
+    def apply(self, stmt):
+        if self.action is not None:
+            stmt = stmt.where(models.AuditLog.action == self.action)
+        if self.user_id is not None:
+            stmt = stmt.where(models.AuditLog.user_id == self.user_id)
+        if self.target_type is not None:
+            stmt = stmt.where(models.AuditLog.target_type == self.target_type)
+        if self.target_id is not None:
+            stmt = stmt.where(models.AuditLog.target_id == self.target_id)
+        if self.since is not None:
+            stmt = stmt.where(models.AuditLog.timestamp >= self.since)
+        if self.until is not None:
+            stmt = stmt.where(models.AuditLog.timestamp < self.until)
+        return stmt
+
+async def audit_filters(
+    action: Optional[str] = None,
+    user_id: Optional[int] = None,
+    target_type: Optional[str] = None,
+    target_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> AuditFilters:
+    # Async: FastAPI runs sync dependencies, classes included, in the threadpool
+    return AuditFilters(action, user_id, target_type, target_id, since, until)
+
+@router.get("/", response_model=Union[List[schemas.AuditLogDisplay], schemas.AuditLogPage])
+async def get_audit_logs(
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    filters: AuditFilters = Depends(audit_filters),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_db)
 ):
     # Only admin can view audit logs
     if current_user.role != "admin":
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN, 
+            status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to view audit logs"
         )
-    
-    logs = db.query(models.AuditLog).order_by(models.AuditLog.timestamp.desc()).offset(skip).limit(limit).all()
-    return logs
+
+    stmt = filters.apply(select(models.AuditLog))
+
+    # Cursor mode: pass cursor= (empty) for the first page, then the returned next_cursor
+    if cursor is not None:
+        columns = (models.AuditLog.timestamp, models.AuditLog.id)
+        stmt = keyset_page(stmt, columns, cursor, limit, (datetime.fromisoformat, int))
+        items, next_cursor = page_results((await db.execute(stmt)).scalars().all(), columns, limit)
+        return {"items": items, "next_cursor": next_cursor}
+
+    # Offset mode, kept for existing clients
+    stmt = stmt.order_by(models.AuditLog.timestamp.desc(), models.AuditLog.id.desc())
+    result = await db.execute(stmt.offset(skip).limit(limit))
+    return result.scalars().all()
+
+@router.get("/export")
+async def export_audit_logs(
+    format: str = Query("csv", pattern=export.EXPORT_FORMAT_PATTERN),
+    filters: AuditFilters = Depends(audit_filters),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view audit logs"
+        )
+
+    stmt = filters.apply(select(*models.AuditLog.__table__.columns))
+    stmt = stmt.order_by(models.AuditLog.timestamp.desc(), models.AuditLog.id.desc())
+    return export.export_response(stmt, format, "audit_logs", caller=current_user.id)
@@ -1,23 +1,35 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from datetime import timedelta
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
 from typing import Annotated
 from slowapi import Limiter
 from slowapi.util import get_remote_address
-import models, schemas, auth, database
+import models, schemas, auth, database, passwords
 
 router = APIRouter(tags=["Authentication"])
 limiter = Limiter(key_func=get_remote_address)
 
-@router.post("/register", response_model=schemas.User)
+def password_hasher_busy():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Authentication service is busy, please retry",
+        headers={"Retry-After": "1"},
+    )
+
+@router.post("/register", response_model=schemas.UserProfile)
 @limiter.limit("3/minute")
-def register_user(request: Request, user: schemas.UserCreate, db: Session = Depends(database.get_db)):
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
+async def register_user(request: Request, user: schemas.UserCreate, db: AsyncSession = Depends(database.get_db)):
+    db_user = (await db.execute(select(models.User).where(models.User.email == user.email))).scalars().first()
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = auth.get_password_hash(user.password)
+    # Argon2 runs in the password worker pool, not in the request threadpool
+    try:
+        hashed_password = await passwords.hash_password_async(user.password)
+    except passwords.PasswordHasherBusy:
+        raise password_hasher_busy()
     new_user = models.User(
         email=user.email,
         hashed_password=hashed_password,
@@ -25,32 +37,95 @@ def register_user(request: Request, user: schemas.UserCreate, db: Session = Depe
         role=user.role
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     return new_user
 
 @router.post("/token", response_model=schemas.Token)
 @limiter.limit("5/minute")
-def login_for_access_token(request: Request, form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: Session = Depends(database.get_db)):
-    print(f"Login attempt for username: '{form_data.username}'")
-    user = db.query(models.User).filter(models.User.email == form_data.username).first()
-    if user:
-        print(f"User found: {user.email}, Role: {user.role}")
-        is_valid = auth.verify_password(form_data.password, user.hashed_password)
-        print(f"Password valid: {is_valid}")
-    else:
-        print("User not found")
-
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(request: Request, form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: AsyncSession = Depends(database.get_db)):
+    user = (await db.execute(select(models.User).where(models.User.email == form_data.username))).scalars().first()
+
+    # Exactly one Argon2 verification per attempt, in the password worker pool
+    try:
+        is_valid = user is not None and await passwords.verify_password_async(form_data.password, user.hashed_password)
+    except passwords.PasswordHasherBusy:
+        raise password_hasher_busy()
+
+    if not is_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    refresh_token = auth.create_refresh_token(db, user.id)
+    await db.commit()
+
+    return issue_tokens(user.email, user.role, refresh_token)
+
+@router.post("/token/refresh", response_model=schemas.Token)
+@limiter.limit("30/minute")
+async def refresh_access_token(request: Request, body: schemas.RefreshRequest, db: AsyncSession = Depends(database.get_db)):
+    invalid_token = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    # One indexed lookup (unique token_hash), no Argon2
+    result = await db.execute(
+        select(models.RefreshToken, models.User.email, models.User.role)
+        .join(models.User, models.User.id == models.RefreshToken.user_id)
+        .where(models.RefreshToken.token_hash == auth.hash_refresh_token(body.refresh_token))
+    )
+    row = result.first()
+    if row is None:
+        raise invalid_token
+    stored, email, role = row
+
+    now = datetime.utcnow()
+    if stored.expires_at <= now:
+        raise invalid_token
+
+    # Rotation: the presented token is consumed atomically. If it was already consumed,
+    # someone replayed it (stolen token or a race): revoke the whole login family.
+    consumed = (await db.execute(
+        update(models.RefreshToken)
+        .where(models.RefreshToken.id == stored.id, models.RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=now)
+    )).rowcount
+    if not consumed:
+        await revoke_family(db, stored.family_id, now)
+        await db.commit()
+        raise invalid_token
+
+    refresh_token = auth.create_refresh_token(db, stored.user_id, stored.family_id)
+    await db.commit()
+    return issue_tokens(email, role, refresh_token)
+
+@router.post("/token/revoke", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_refresh_token(body: schemas.RefreshRequest, db: AsyncSession = Depends(database.get_db)):
+    # Logout: revoke the presented token and every rotation of it. Unknown tokens are ignored.
+    result = await db.execute(
+        select(models.RefreshToken.family_id)
+        .where(models.RefreshToken.token_hash == auth.hash_refresh_token(body.refresh_token))
+    )
+    family_id = result.scalar()
+    if family_id is not None:
+        await revoke_family(db, family_id, datetime.utcnow())
+        await db.commit()
+    return None
+
+async def revoke_family(db: AsyncSession, family_id: str, now: datetime):
+    await db.execute(
+        update(models.RefreshToken)
+        .where(models.RefreshToken.family_id == family_id, models.RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=now)
+    )
+
+def issue_tokens(email: str, role: str, refresh_token: str):
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
-        data={"sub": user.email, "role": user.role},
+        data={"sub": email, "role": role},
         expires_delta=access_token_expires
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
@@ -1,29 +1,85 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-import models, schemas, auth, database
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Union
+from datetime import datetime
+import asyncio
+import json
+import logging
+import os
+import models, schemas, auth, database, etags, ticket_cache
+from broker import broker, MAX_PAYLOAD
+from pagination import keyset_page, page_results
+
+# Seconds between SSE keep-alive comments (also how often a gone client is noticed)
+COMMENT_STREAM_KEEPALIVE = float(os.getenv("COMMENT_STREAM_KEEPALIVE", "15"))
+# Comments replayed to a client reconnecting with Last-Event-ID
+COMMENT_REPLAY_LIMIT = 200
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/tickets/{ticket_id}/comments",
     tags=["comments"]
 )
 
-@router.get("/", response_model=List[schemas.Comment])
-def read_comments(ticket_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+def comments_after(stmt, ticket_id: int, after: int):
+    """
+    Restrict `stmt` to the ticket's comments that come after comment `after` in
+    (created_at, id) order. An id that is not in the thread (e.g. 0) means from the start.
+    """
+    anchor = func.coalesce(
+        select(models.Comment.created_at)
+        .where(models.Comment.id == after, models.Comment.ticket_id == ticket_id)
+        .scalar_subquery(),
+        datetime.min,
+    )
+    return stmt.where(tuple_(models.Comment.created_at, models.Comment.id) > tuple_(anchor, after))
+
+@router.get("/", response_model=Union[List[schemas.Comment], schemas.CommentPage])
+async def read_comments(
+    ticket_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    after: Optional[int] = None,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: auth.Principal = Depends(auth.get_current_user)
+):
+    """
+    Oldest first. Without cursor or after: the first `limit` comments as a plain list
+    (existing clients). cursor= (empty, then next_cursor) pages through the thread;
+    after=<comment id> returns only the comments posted after it.
+    """
     # Verify ticket exists and user has access
-    ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
+    ticket = await db.get(models.Ticket, ticket_id)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
     
     if current_user.role != "admin" and ticket.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to view comments for this ticket")
 
-    return db.query(models.Comment).filter(models.Comment.ticket_id == ticket_id).all()
+    etag = etags.make_etag("comments", ticket_id, ticket.version, request.url.query)
+    if etags.not_modified(request, etag):
+        return etags.not_modified_response(etag)
+    etags.set_etag(response, etag)
+
+    stmt = select(models.Comment).where(models.Comment.ticket_id == ticket_id)
+    if after is not None:
+        stmt = comments_after(stmt, ticket_id, after)
+    columns = (models.Comment.created_at, models.Comment.id)
+    stmt = keyset_page(stmt, columns, cursor, limit, (datetime.fromisoformat, int), descending=False)
+    items, next_cursor = page_results((await db.execute(stmt)).scalars().all(), columns, limit)
+    if cursor is None and after is None:
+        return items
+    return {"items": items, "next_cursor": next_cursor}
 
 @router.post("/", response_model=schemas.Comment)
-def create_comment(ticket_id: int, comment: schemas.CommentCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+async def create_comment(ticket_id: int, comment: schemas.CommentCreate, db: AsyncSession = Depends(database.get_db), current_user: auth.Principal = Depends(auth.get_current_user)):
     # Verify ticket exists and user has access
-    ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
+    ticket = await db.get(models.Ticket, ticket_id)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
     
@@ -36,6 +92,91 @@ def create_comment(ticket_id: int, comment: schemas.CommentCreate, db: Session =
         author_id=current_user.id
     )
     db.add(db_comment)
-    db.commit()
-    db.refresh(db_comment)
+    # A new comment changes the ticket's thread: new ETags for the ticket and its comments
+    version = await etags.bump_version(db, ticket_id, ticket.owner_id)
+    await db.commit()
+    await db.refresh(db_comment)
+    await ticket_cache.invalidate(ticket_id, version)
+
+    # Push to the ticket's open streams; too big for NOTIFY -> subscribers load it by id
+    payload = schemas.Comment.model_validate(db_comment).model_dump_json()
+    if len(payload.encode()) > MAX_PAYLOAD:
+        payload = json.dumps({"id": db_comment.id, "ticket_id": ticket_id})
+    try:
+        await broker.publish(f"ticket:{ticket_id}", payload)
+    except Exception:
+        # The comment is committed: the streams will get it on their next replay
+        logger.exception("Could not publish comment %s", db_comment.id)
     return db_comment
+
+
+def _sse(comment: dict) -> str:
+    return f"id: {comment['id']}\nevent: comment\ndata: {json.dumps(comment)}\n\n"
+
+async def comment_events(request: Request, channel: str, queue: asyncio.Queue, backlog: list, caller: int):
+    """
+    Server-sent events for one ticket: the replayed backlog, then each new comment
+    as it is published. A live comment already sent in the backlog is skipped; any
+    other is pushed, even one with a lower id that committed late.
+    """
+    replayed = set()
+    try:
+        for comment in backlog:
+            replayed.add(comment["id"])
+            yield _sse(comment)
+        while not await request.is_disconnected():
+            try:
+                payload = await asyncio.wait_for(queue.get(), COMMENT_STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if payload is None:
+                break  # cut off by the broker, the client reconnects with Last-Event-ID
+            comment = json.loads(payload)
+            if comment["id"] in replayed:
+                replayed.discard(comment["id"])
+                continue
+            if "content" not in comment:
+                async with database.streaming_session(caller) as db:
+                    comment = schemas.Comment.model_validate(
+                        await db.get(models.Comment, comment["id"])
+                    ).model_dump(mode="json")
+            yield _sse(comment)
+    finally:
+        broker.unsubscribe(channel, queue)
+
+@router.get("/stream")
+async def stream_comments(
+    ticket_id: int,
+    request: Request,
+    last_event_id: Optional[int] = Header(None),
+    db: AsyncSession = Depends(database.get_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    ticket = await db.get(models.Ticket, ticket_id)
+    if not ticket:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+
+    if current_user.role != "admin" and ticket.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to view comments for this ticket")
+
+    # Subscribe before reading the backlog so nothing committed in between is missed
+    channel = f"ticket:{ticket_id}"
+    queue = broker.subscribe(channel)
+    backlog = []
+    try:
+        if last_event_id is not None:
+            stmt = comments_after(select(models.Comment).where(models.Comment.ticket_id == ticket_id), ticket_id, last_event_id)
+            result = await db.execute(
+                stmt.order_by(models.Comment.created_at, models.Comment.id).limit(COMMENT_REPLAY_LIMIT)
+            )
+            backlog = [schemas.Comment.model_validate(c).model_dump(mode="json") for c in result.scalars()]
+    except BaseException:
+        broker.unsubscribe(channel, queue)
+        raise
+
+    return StreamingResponse(
+        comment_events(request, channel, queue, backlog, current_user.id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,10 +1,14 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     email: Optional[str] = None
@@ -34,6 +38,10 @@ class Comment(CommentBase):
     class Config:
         from_attributes = True
 
+class CommentPage(BaseModel):
+    items: List[Comment]
+    next_cursor: Optional[str] = None
+
 class Ticket(TicketBase):
     id: int
     status: str
@@ -45,6 +53,41 @@ class Ticket(TicketBase):
     class Config:
         from_attributes = True
 
+class TicketPage(BaseModel):
+    items: List[Ticket]
+    next_cursor: Optional[str] = None
+
+class TicketSummary(BaseModel):
+    id: int
+    title: str
+    status: str
+    priority: str
+    category: str
+    created_at: datetime
+    owner_id: Optional[int] = None
+    comment_count: int = 0
+
+    class Config:
+        from_attributes = True
+
+class TicketSummaryPage(BaseModel):
+    items: List[TicketSummary]
+    next_cursor: Optional[str] = None
+
+class TicketSearchHit(TicketSummary):
+    rank: float
+
+class TicketSearchPage(BaseModel):
+    items: List[TicketSearchHit]
+    next_cursor: Optional[str] = None
+
+class TicketStats(BaseModel):
+    total: int
+    by_status: Dict[str, int]
+    by_priority: Dict[str, int]
+    by_category: Dict[str, int]
+    by_owner_role: Dict[str, int]
+
 class UserBase(BaseModel):
     email: str
     full_name: Optional[str] = None
@@ -53,6 +96,12 @@ class UserBase(BaseModel):
 class UserCreate(UserBase):
     password: str
 
+class UserProfile(UserBase):
+    id: int
+
+    class Config:
+        from_attributes = True
+
 class User(UserBase):
     id: int
     tickets: List[Ticket] = []
@@ -73,3 +122,7 @@ class AuditLogDisplay(AuditLogBase):
     
     class Config:
         from_attributes = True
+
+class AuditLogPage(BaseModel):
+    items: List[AuditLogDisplay]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,100 @@
+"""
+Full-text search over ticket titles and descriptions.
+
+Postgres: a generated `tsvector` column on tickets with a GIN index.
+SQLite: an external-content FTS5 table kept in sync by triggers (used by the tests
+and local runs without Postgres). Both expose the same ranked (id, rank) subquery,
+higher rank meaning more relevant.
+"""
+import os
+
+from sqlalchemy import func, literal_column, select, text
+
+import models
+
+# 'simple' avoids language-specific stemming: tickets are written in French and English
+SEARCH_TS_CONFIG = os.getenv("SEARCH_TS_CONFIG", "simple")
+
+_POSTGRES_DDL = [
+    f"""
+    ALTER TABLE tickets ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('{SEARCH_TS_CONFIG}', coalesce(title, '') || ' ' || coalesce(description, ''))
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_tickets_search_vector ON tickets USING GIN (search_vector)",
+]
+
+_SQLITE_DDL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS tickets_fts_ai AFTER INSERT ON tickets BEGIN
+        INSERT INTO tickets_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tickets_fts_ad AFTER DELETE ON tickets BEGIN
+        INSERT INTO tickets_fts(tickets_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tickets_fts_au AFTER UPDATE OF title, description ON tickets BEGIN
+        INSERT INTO tickets_fts(tickets_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO tickets_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+
+def install(engine):
+    """Create the search column/index (Postgres) or FTS table and triggers (SQLite). Idempotent."""
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            for statement in _POSTGRES_DDL:
+                conn.execute(text(statement))
+        elif engine.dialect.name == "sqlite":
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tickets_fts'")
+            ).first()
+            if not exists:
+                conn.execute(text(
+                    "CREATE VIRTUAL TABLE tickets_fts USING fts5("
+                    "title, description, content='tickets', content_rowid='id', "
+                    "tokenize='unicode61 remove_diacritics 2')"
+                ))
+                # Index the tickets that existed before search was installed
+                conn.execute(text("INSERT INTO tickets_fts(tickets_fts) VALUES ('rebuild')"))
+            for statement in _SQLITE_DDL:
+                conn.execute(text(statement))
+
+
+def is_supported(dialect_name: str) -> bool:
+    return dialect_name in ("postgresql", "sqlite")
+
+
+def _fts5_query(q: str) -> str:
+    # Quote every term so user input can never be parsed as FTS5 syntax (AND, NEAR, *, ...)
+    return " ".join('"' + term.replace('"', '""') + '"' for term in q.split())
+
+
+def ranked_ticket_ids(dialect_name: str, q: str):
+    """
+    Subquery of (id, rank) for the tickets matching `q`, to be joined to a ticket query.
+    """
+    if dialect_name == "postgresql":
+        vector = literal_column("tickets.search_vector")
+        tsquery = func.websearch_to_tsquery(SEARCH_TS_CONFIG, q)
+        return (
+            select(models.Ticket.id.label("id"), func.ts_rank(vector, tsquery).label("rank"))
+            .where(vector.op("@@")(tsquery))
+            .subquery("ranked")
+        )
+
+    fts = literal_column("tickets_fts")
+    return (
+        select(literal_column("tickets_fts.rowid").label("id"), (-func.bm25(fts)).label("rank"))
+        .select_from(text("tickets_fts"))
+        .where(fts.op("MATCH")(_fts5_query(q)))
+        .subquery("ranked")
+    )
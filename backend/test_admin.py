@@ -0,0 +1,105 @@
+import pytest
+
+
+def test_pool_status_reports_checkouts_and_waits(client, admin_headers):
+    client.get("/tickets", headers=admin_headers)
+    status = client.get("/admin/pool", headers=admin_headers).json()
+
+    assert status["pool_class"] == "InstrumentedAsyncPool"
+    assert status["checkouts"] >= 2
+    assert status["checked_out"] == 1  # the connection serving this very request
+    assert status["timeouts"] == 0
+    waits = status["wait_seconds"]
+    assert waits["count"] == status["checkouts"] and waits["buckets"]["+Inf"] == waits["count"]
+
+
+def test_pool_status_is_admin_only(client, student_headers):
+    assert client.get("/admin/pool", headers=student_headers).status_code == 403
+
+
+def test_engine_options_follow_the_environment(monkeypatch):
+    import database
+    monkeypatch.setattr(database, "DB_POOL_SIZE", 3)
+    monkeypatch.setattr(database, "DB_STATEMENT_TIMEOUT_MS", 2500)
+
+    options = database._engine_options("postgresql+asyncpg://u:p@db/helpdesk", is_async=True)
+    assert options["pool_size"] == 3 and issubclass(options["poolclass"], database.InstrumentedAsyncPool)
+    assert options["connect_args"] == {"server_settings": {"statement_timeout": "2500"}}
+
+    options = database._engine_options("postgresql://u:p@db/helpdesk", is_async=False)
+    assert options["connect_args"] == {"options": "-c statement_timeout=2500"}
+    assert "connect_args" not in database._engine_options("sqlite:///./x.db", is_async=False)
+    assert database._engine_options("sqlite://", is_async=True) == {}
+
+
+def test_reads_go_to_replica_until_the_caller_writes(client, db, student_headers, clean_tickets, monkeypatch):
+    import shutil, sqlite3
+    import database, models
+    if database.engine.dialect.name != "sqlite":
+        pytest.skip("builds the replica by copying the SQLite file")
+
+    # A stale "replica": a copy of the primary holding one ticket the primary lacks
+    primary_path = database.engine.url.database
+    replica_path = primary_path + ".replica"
+    shutil.copyfile(primary_path, replica_path)
+    student = db.query(models.User).filter(models.User.email == "student@helpdesk.com").one()
+    with sqlite3.connect(replica_path) as conn:
+        conn.execute(
+            "INSERT INTO tickets (title, description, status, priority, category, owner_id, created_at) "
+            "VALUES ('replica only', '', 'open', 'low', 'other', ?, CURRENT_TIMESTAMP)",
+            (student.id,),
+        )
+    database.configure_replicas([f"sqlite:///{replica_path}"])
+    monkeypatch.setattr(database, "_recent_writers", {})
+    try:
+        titles = lambda: [t["title"] for t in client.get("/tickets?cursor=", headers=student_headers).json()["items"]]
+        # Served by the replica, whose checkouts are not folded into the primary's figures
+        primary_checkouts = database.pool_metrics.checkouts
+        assert titles() == ["replica only"]
+        assert database.pool_metrics.checkouts == primary_checkouts
+        assert database.pool_status()["replicas"][0]["checkouts"] >= 1
+
+        created = client.post(
+            "/tickets",
+            json={"title": "on primary", "description": "", "priority": "low", "category": "other"},
+            headers=student_headers,
+        )
+        assert created.status_code == 200
+        # Read-your-writes: the writer now reads from the primary
+        assert titles() == ["on primary"]
+        assert len(database.pool_status()["replicas"]) == 1
+    finally:
+        database.configure_replicas([])
+
+
+def test_metrics_endpoint_speaks_prometheus(client, admin_headers):
+    client.get("/tickets", headers=admin_headers)
+    client.get("/tickets/999999", headers=admin_headers)
+    for _ in range(6):
+        last = client.post("/token", data={"username": "student@helpdesk.com", "password": "wrong"})
+    assert last.status_code == 429
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert '# TYPE helpdesk_http_request_duration_seconds histogram' in body
+    assert 'helpdesk_http_requests_total{method="GET",route="/tickets/{ticket_id}",status="404"}' in body
+    assert 'helpdesk_http_request_duration_seconds_bucket{method="GET",route="/tickets",le="+Inf"}' in body
+    assert 'helpdesk_http_requests_in_flight 1' in body  # the scrape itself
+    assert 'helpdesk_rate_limited_total{route="/token"} 1' in body
+    assert 'helpdesk_password_hash_seconds_count{operation="verify"}' in body
+    for name in ("helpdesk_db_pool_checked_out", "helpdesk_db_pool_wait_seconds_count", "helpdesk_audit_queue_depth"):
+        assert f"\n{name} " in body
+
+
+def test_metric_families_render_labels_and_callbacks():
+    from metrics import Registry
+    registry = Registry()
+    registry.counter("jobs_total", "Jobs", ["queue"]).labels('say "hi"').inc(2)
+    registry.gauge("depth", "Depth", fn=lambda: 7).labels()
+    registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0)).labels().observe(0.5)
+    lines = registry.render().splitlines()
+    assert 'jobs_total{queue="say \\"hi\\""} 2' in lines
+    assert "depth 7" in lines
+    assert 'latency_seconds_bucket{le="0.1"} 0' in lines and 'latency_seconds_bucket{le="1.0"} 1' in lines
+    assert "latency_seconds_count 1" in lines
@@ -0,0 +1,186 @@
+import datetime
+
+import pytest
+from sqlalchemy import select, text
+
+import models
+import audit_sink
+from conftest import count_queries
+
+TICKET = {"title": "Printer", "description": "jammed", "priority": "low", "category": "student"}
+
+
+def _audit_rows(db, action, target_id):
+    db.expire_all()
+    return db.query(models.AuditLog).filter(
+        models.AuditLog.action == action, models.AuditLog.target_id == target_id
+    ).all()
+
+
+def test_buffered_audit_is_written_after_the_request(client, db, student_headers, clean_tickets, clean_audit):
+    with count_queries() as queries:
+        response = client.post("/tickets", json=TICKET, headers=student_headers)
+    assert response.status_code == 200
+    assert not [q for q in queries if "audit_logs" in q]
+
+    client.portal.call(audit_sink.flush)
+    rows = _audit_rows(db, "CREATE_TICKET", response.json()["id"])
+    assert len(rows) == 1 and rows[0].details == "Created ticket: Printer"
+
+
+def test_transactional_audit_commits_with_the_ticket(client, db, student_headers, admin_headers, clean_tickets, clean_audit, monkeypatch):
+    ticket_id = client.post("/tickets", json=TICKET, headers=student_headers).json()["id"]
+    # The CREATE_TICKET entry must not be flushed while the queries are counted
+    client.portal.call(audit_sink.flush)
+    monkeypatch.setattr(audit_sink, "AUDIT_DURABILITY", "transactional")
+
+    with count_queries() as queries:
+        client.patch(f"/tickets/{ticket_id}", params={"status": "resolved"}, headers=admin_headers)
+    assert len([q for q in queries if q.startswith("INSERT INTO audit_logs")]) == 1
+    assert len(_audit_rows(db, "UPDATE_STATUS", ticket_id)) == 1
+
+
+def test_shutdown_drains_buffered_entries(app, db, student_headers, clean_tickets, clean_audit, monkeypatch):
+    from fastapi.testclient import TestClient
+    monkeypatch.setattr(audit_sink, "AUDIT_FLUSH_INTERVAL_MS", 60_000)
+
+    with TestClient(app) as test_client:
+        ticket_id = test_client.post("/tickets", json=TICKET, headers=student_headers).json()["id"]
+        assert audit_sink.queue_depth() == 1
+    assert audit_sink.queue_depth() == 0
+    assert len(_audit_rows(db, "CREATE_TICKET", ticket_id)) == 1
+
+
+def _seed_audit(db, count):
+    users = {u.role: u.id for u in db.query(models.User).all()}
+    start = datetime.datetime(2024, 1, 1)
+    for i in range(count):
+        db.add(models.AuditLog(
+            user_id=users["admin"] if i % 2 else users["student"],
+            action="DELETE_TICKET" if i % 3 == 0 else "UPDATE_STATUS",
+            target_type="ticket",
+            target_id=i % 5,
+            timestamp=start + datetime.timedelta(hours=i // 2),  # pairs share a timestamp
+        ))
+    db.commit()
+    return users
+
+
+def test_audit_cursor_pages_cover_every_row_once(client, db, admin_headers, clean_audit):
+    _seed_audit(db, 25)
+    seen, cursor = [], ""
+    while cursor is not None:
+        page = client.get("/audit/", params={"cursor": cursor, "limit": 10}, headers=admin_headers).json()
+        seen += page["items"]
+        cursor = page["next_cursor"]
+    assert len(seen) == 25 and len({log["id"] for log in seen}) == 25
+    keys = [(log["timestamp"], log["id"]) for log in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_audit_filters(client, db, admin_headers, student_headers, clean_audit):
+    users = _seed_audit(db, 30)
+    get = lambda **params: client.get("/audit/", params=params, headers=admin_headers).json()
+
+    assert all(log["action"] == "DELETE_TICKET" for log in get(action="DELETE_TICKET"))
+    assert len(get(action="DELETE_TICKET")) == 10
+    assert {log["user_id"] for log in get(user_id=users["admin"])} == {users["admin"]}
+    assert {log["target_id"] for log in get(target_type="ticket", target_id=3)} == {3}
+    window = get(since="2024-01-01T02:00:00", until="2024-01-01T05:00:00")
+    assert len(window) == 6
+    assert client.get("/audit/", headers=student_headers).status_code == 403
+
+
+def test_audit_export_streams_filtered_rows(client, db, admin_headers, student_headers, clean_audit):
+    import json
+    _seed_audit(db, 12)
+    response = client.get("/audit/export", params={"format": "ndjson", "action": "DELETE_TICKET"}, headers=admin_headers)
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 4 and {line["action"] for line in lines} == {"DELETE_TICKET"}
+
+    assert len(client.get("/audit/export", headers=admin_headers).text.splitlines()) == 13  # header + rows
+    assert client.get("/audit/export", headers=student_headers).status_code == 403
+
+
+def test_audit_listing_walks_an_index(app, db):
+    import database
+    from routers.audit import AuditFilters
+    from pagination import keyset_page
+    if database.engine.dialect.name != "sqlite":
+        pytest.skip("reads the SQLite query plan")
+
+    cases = (
+        (AuditFilters(), "ix_audit_logs_timestamp_id"),
+        (AuditFilters(user_id=1), "ix_audit_logs_user_id_timestamp"),
+        (AuditFilters(action="DELETE_TICKET"), "ix_audit_logs_action_timestamp"),
+        (AuditFilters(target_type="ticket", target_id=1), "ix_audit_logs_target"),
+    )
+    for filters, index in cases:
+        stmt = keyset_page(filters.apply(select(models.AuditLog)), (models.AuditLog.timestamp, models.AuditLog.id), None, 50, ())
+        sql = str(stmt.compile(database.engine, compile_kwargs={"literal_binds": True}))
+        plan = " ".join(row[-1] for row in db.execute(text("EXPLAIN QUERY PLAN " + sql)))
+        assert f"INDEX {index}" in plan and "TEMP B-TREE" not in plan
+
+
+def test_audit_indexes_are_added_to_an_existing_database(app):
+    import database
+    from sqlalchemy import inspect
+    if database.engine.dialect.name != "sqlite":
+        pytest.skip("Postgres gets them from the partition migration")
+    with database.engine.begin() as conn:
+        for index in models.AuditLog.__table__.indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    database.ensure_indexes(database.engine, models.AuditLog.__table__)
+    names = {index["name"] for index in inspect(database.engine).get_indexes("audit_logs")}
+    assert {index.name for index in models.AuditLog.__table__.indexes} <= names
+
+
+def test_retention_archives_whole_months_and_reads_them_back(app, db, clean_audit, tmp_path, monkeypatch):
+    import audit_archive
+    monkeypatch.setattr(audit_archive, "AUDIT_RETENTION_DAYS", 30)
+    _seed_audit(db, 30)  # 2024-01-01 00:00 .. 2024-01-01 14:00
+    db.add(models.AuditLog(user_id=1, action="LOGIN", target_type="user", target_id=1,
+                           timestamp=datetime.datetime(2024, 2, 20)))
+    db.commit()
+
+    # Cutoff 2024-02-24: January is a whole expired month, February is not
+    archived = audit_archive.archive_expired(now=datetime.datetime(2024, 3, 25), archive_dir=str(tmp_path))
+    assert archived == {"2024-01": 30}
+    db.expire_all()
+    assert [log.action for log in db.query(models.AuditLog).all()] == ["LOGIN"]
+    assert [p.name for p in tmp_path.iterdir()] == ["audit_logs_2024-01.ndjson.gz"]
+
+    entries = list(audit_archive.iter_archived(archive_dir=str(tmp_path)))
+    assert len(entries) == 30
+    assert [e["timestamp"] for e in entries] == sorted(e["timestamp"] for e in entries)
+    window = audit_archive.iter_archived(
+        since=datetime.datetime(2024, 1, 1, 2), until=datetime.datetime(2024, 1, 1, 5), archive_dir=str(tmp_path)
+    )
+    assert len(list(window)) == 6
+    assert list(audit_archive.iter_archived(since=datetime.datetime(2024, 2, 1), archive_dir=str(tmp_path))) == []
+
+
+def test_partitions_keep_being_created_while_the_app_runs(monkeypatch):
+    import asyncio
+    import audit_archive
+    calls = []
+    monkeypatch.setattr(audit_archive, "AUDIT_PARTITION_CHECK_SECONDS", 0)
+
+    def ensure(bind):
+        calls.append(bind)
+        if len(calls) == 1:
+            raise RuntimeError("database away")  # logged, retried next round
+    monkeypatch.setattr(audit_archive, "_ensure_upcoming", ensure)
+
+    class FakePostgres:
+        class dialect:
+            name = "postgresql"
+
+    async def run():
+        task = audit_archive.start(FakePostgres)
+        while len(calls) < 3:
+            await asyncio.sleep(0.01)
+        await audit_archive.stop()
+        assert task.cancelled()
+    asyncio.run(run())
+    assert calls[:3] == [FakePostgres] * 3
@@ -0,0 +1,180 @@
+import models
+from conftest import count_queries, seed_commented_tickets
+
+
+def test_me_is_a_compact_profile(client, db, student_headers, clean_tickets):
+    seed_commented_tickets(db, 5)
+
+    with count_queries() as queries:
+        response = client.get("/me", headers=student_headers)
+    assert response.status_code == 200
+    assert set(response.json()) == {"id", "email", "full_name", "role"}
+    assert len(queries) == 1
+
+
+def test_my_tickets_are_paginated(client, db, student_headers, clean_tickets):
+    seed_commented_tickets(db, 5)
+    teacher = db.query(models.User).filter(models.User.email == "teacher@helpdesk.com").first()
+    db.add(models.Ticket(title="not mine", description="d", category="teacher", owner_id=teacher.id))
+    db.commit()
+
+    first = client.get("/me/tickets", params={"cursor": "", "limit": 3}, headers=student_headers).json()
+    second = client.get("/me/tickets", params={"cursor": first["next_cursor"], "limit": 3},
+                        headers=student_headers).json()
+    titles = [t["title"] for t in first["items"] + second["items"]]
+    assert len(titles) == 5 and "not mine" not in titles
+    assert second["next_cursor"] is None
+
+
+def test_principal_cache_skips_the_user_lookup(client, db, student_headers, admin_headers, monkeypatch):
+    import auth
+    from cache import TTLCache
+    monkeypatch.setattr(auth, "principal_cache", TTLCache(maxsize=100, ttl=60))
+
+    client.get("/me", headers=student_headers)
+    with count_queries() as queries:
+        response = client.get("/me", headers=student_headers)
+    assert response.json()["role"] == "student"
+    assert queries == []
+
+    stats = client.get("/admin/cache-stats", headers=admin_headers).json()["principals"]
+    assert stats["hits"] == 1 and stats["misses"] == 2  # student miss, student hit, admin miss
+
+    # A role change through the ORM drops the cached principal, at commit: a read
+    # between the flush and the commit must not put the old role back for the TTL
+    student = db.query(models.User).filter(models.User.email == "student@helpdesk.com").one()
+    student.role = "teacher"
+    db.flush()
+    assert client.get("/me", headers=student_headers).json()["role"] == "student"
+    db.commit()
+    try:
+        assert client.get("/me", headers=student_headers).json()["role"] == "teacher"
+    finally:
+        student.role = "student"
+        db.commit()
+    assert client.get("/me", headers=student_headers).json()["role"] == "student"
+
+
+def test_cache_stats_are_admin_only(client, student_headers):
+    assert client.get("/admin/cache-stats", headers=student_headers).status_code == 403
+
+
+def test_ttl_cache_expires_and_evicts():
+    from cache import TTLCache
+    now = [0.0]
+    cache = TTLCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # evicts "b", the least recently used
+    assert cache.get("b") is None and cache.evictions == 1
+    now[0] = 11
+    assert cache.get("a") is None
+
+
+def test_ttl_cache_respects_a_byte_budget():
+    from cache import TTLCache
+    cache = TTLCache(maxsize=100, ttl=10, maxbytes=10)
+    cache.set("a", b"1234")
+    cache.set("b", b"1234")
+    cache.set("c", b"1234")  # 12 bytes: "a" goes
+    assert cache.get("a") is None and cache.bytes == 8 and cache.evictions == 1
+    cache.set("huge", b"x" * 11)  # never fits
+    assert cache.get("huge") is None and cache.bytes == 8
+    cache.invalidate("b")
+    assert cache.bytes == 4 and cache.stats()["maxbytes"] == 10
+
+
+def test_login_verifies_in_the_password_pool(client):
+    response = client.post("/token", data={"username": "student@helpdesk.com", "password": "student123"})
+    assert response.status_code == 200
+    token = response.json()["access_token"]
+    assert client.get("/me", headers={"Authorization": f"Bearer {token}"}).json()["email"] == "student@helpdesk.com"
+
+    response = client.post("/token", data={"username": "student@helpdesk.com", "password": "wrong"})
+    assert response.status_code == 401
+    response = client.post("/token", data={"username": "nobody@helpdesk.com", "password": "wrong"})
+    assert response.status_code == 401
+
+
+def test_login_is_shed_when_the_password_queue_is_full(client, monkeypatch):
+    import passwords
+    monkeypatch.setattr(passwords, "PASSWORD_HASH_MAX_PENDING", 0)
+    response = client.post("/token", data={"username": "student@helpdesk.com", "password": "student123"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_register_hashes_off_the_request_thread(client, db):
+    import passwords
+    response = client.post("/register", json={"email": "new.user@helpdesk.com", "password": "s3cret!",
+                                              "full_name": "New User", "role": "student"})
+    assert response.status_code == 200
+    user = db.query(models.User).filter(models.User.email == "new.user@helpdesk.com").one()
+    assert passwords.verify_password("s3cret!", user.hashed_password)
+    db.delete(user)
+    db.commit()
+
+
+def _login(client, email="student@helpdesk.com", password="student123"):
+    response = client.post("/token", data={"username": email, "password": password})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_refresh_rotates_without_password_verification(client, monkeypatch):
+    import passwords
+    tokens = _login(client)
+    assert tokens["refresh_token"]
+
+    def no_argon2(*args):
+        raise AssertionError("refresh must not verify a password")
+    monkeypatch.setattr(passwords, "verify_password_async", no_argon2)
+
+    with count_queries() as queries:
+        response = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    assert len([q for q in queries if q.lstrip().upper().startswith("SELECT")]) == 1
+    rotated = response.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    me = client.get("/me", headers={"Authorization": f"Bearer {rotated['access_token']}"})
+    assert me.json()["email"] == "student@helpdesk.com"
+
+
+def test_refresh_token_reuse_revokes_the_family(client):
+    first = _login(client)["refresh_token"]
+    second = client.post("/token/refresh", json={"refresh_token": first}).json()["refresh_token"]
+
+    # Replaying the consumed token is treated as theft...
+    assert client.post("/token/refresh", json={"refresh_token": first}).status_code == 401
+    # ...so the legitimate holder's newer token is dead too
+    assert client.post("/token/refresh", json={"refresh_token": second}).status_code == 401
+
+    other_login = _login(client)["refresh_token"]
+    assert client.post("/token/refresh", json={"refresh_token": other_login}).status_code == 200
+
+
+def test_revoked_and_unknown_refresh_tokens_are_rejected(client):
+    token = _login(client)["refresh_token"]
+    assert client.post("/token/revoke", json={"refresh_token": token}).status_code == 204
+    assert client.post("/token/refresh", json={"refresh_token": token}).status_code == 401
+    assert client.post("/token/refresh", json={"refresh_token": "made-up"}).status_code == 401
+
+
+def test_purge_drops_only_expired_refresh_tokens(client, db):
+    import auth
+    from datetime import datetime, timedelta
+    family = lambda token: db.query(models.RefreshToken).filter(
+        models.RefreshToken.token_hash == auth.hash_refresh_token(token)
+    ).one().family_id
+    first = _login(client)["refresh_token"]
+    client.post("/token/refresh", json={"refresh_token": first})  # revoked, kept for replay detection
+    family_id = family(first)
+
+    assert auth.purge_refresh_tokens(db) >= 0
+    db.expire_all()
+    assert db.query(models.RefreshToken).filter(models.RefreshToken.family_id == family_id).count() == 2
+
+    later = datetime.utcnow() + timedelta(days=auth.REFRESH_TOKEN_EXPIRE_DAYS, minutes=1)
+    assert auth.purge_refresh_tokens(db, now=later) >= 2
+    assert db.query(models.RefreshToken).filter(models.RefreshToken.family_id == family_id).count() == 0
@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+import bench
+import models
+
+
+def test_percentile_nearest_rank():
+    samples = [i / 1000 for i in range(1, 101)]
+    assert bench.percentile(samples, 50) == 0.05
+    assert bench.percentile(samples, 99) == 0.099
+    assert bench.percentile([], 95) == 0.0
+
+
+def test_compare_reports_relative_change():
+    baseline = {"endpoints": {"GET /tickets": {"p50_ms": 10.0, "p95_ms": 20.0, "p99_ms": 40.0, "throughput_rps": 100.0}}}
+    current = {"endpoints": {
+        "GET /tickets": {"p50_ms": 5.0, "p95_ms": 20.0, "p99_ms": 50.0, "throughput_rps": 150.0},
+        "GET /audit": {"p50_ms": 1.0, "p95_ms": 1.0, "p99_ms": 1.0, "throughput_rps": 1.0},
+    }}
+    diff = bench.compare(current, baseline)
+    assert set(diff) == {"GET /tickets"}
+    assert diff["GET /tickets"]["p50_ms"]["change_pct"] == -50.0
+    assert diff["GET /tickets"]["throughput_rps"]["change_pct"] == 50.0
+
+
+def test_remote_runs_need_the_server_database():
+    with pytest.raises(SystemExit):
+        bench.main(["--url", "http://localhost:8000"])
+    with pytest.raises(SystemExit):
+        bench.main(["--url", "http://localhost:8000", "--database-url", "sqlite:///x.db", "--reset"])
+
+
+def test_same_seed_can_be_seeded_twice_into_one_database(app, db, clean_tickets):
+    first = bench.seed(users=2, tickets=4, comments_per_ticket=0, audit_rows=0, rng=random.Random(7))
+    second = bench.seed(users=2, tickets=4, comments_per_ticket=0, audit_rows=0, rng=random.Random(7))
+    assert {u["email"] for u in first["users"]}.isdisjoint(u["email"] for u in second["users"])
+    for user in first["users"] + second["users"]:
+        assert db.get(models.User, user["id"]).email == user["email"]
+
+
+def test_benchmark_drives_every_endpoint(client, clean_tickets, monkeypatch):
+    import main
+    from routers import auth as auth_router
+    monkeypatch.setattr(main.limiter, "enabled", False)
+    monkeypatch.setattr(auth_router.limiter, "enabled", False)
+
+    dataset = bench.seed(users=3, tickets=20, comments_per_ticket=2, audit_rows=50, rng=random.Random(1))
+    assert sum(len(ids) for ids in dataset["tickets_by_user"].values()) == 20
+
+    report = client.portal.call(lambda: bench.run_benchmark(
+        app=client.app, concurrency=3, duration=1.5, dataset=dataset, seed=1, lifespan=False,
+    ))
+    assert {name for name, _ in bench.WORKLOAD} <= set(report)
+    for figures in report.values():
+        assert figures["errors"] == 0
+        assert figures["p50_ms"] <= figures["p95_ms"] <= figures["p99_ms"]
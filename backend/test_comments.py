@@ -0,0 +1,202 @@
+import json
+
+import pytest
+
+import models
+from broker import broker, InProcessBroker
+
+
+def _ticket(db, owner_email="student@helpdesk.com"):
+    owner = db.query(models.User).filter(models.User.email == owner_email).first()
+    ticket = models.Ticket(title="Thread", description="d", category=owner.role, owner_id=owner.id)
+    db.add(ticket)
+    db.commit()
+    return ticket.id
+
+
+class _Request:
+    """Stands in for the Starlette request: connected for `polls` checks."""
+
+    def __init__(self, polls):
+        self.polls = polls
+
+    async def is_disconnected(self):
+        self.polls -= 1
+        return self.polls < 0
+
+
+def test_new_comment_is_published_to_the_ticket_channel(client, db, student_headers, clean_tickets):
+    ticket_id = _ticket(db)
+    queue = broker.subscribe(f"ticket:{ticket_id}")
+    try:
+        comment = client.post(f"/tickets/{ticket_id}/comments/", json={"content": "hello"}, headers=student_headers).json()
+        assert json.loads(client.portal.call(queue.get_nowait)) == comment
+    finally:
+        broker.unsubscribe(f"ticket:{ticket_id}", queue)
+    assert broker.subscriber_count() == 0
+
+
+def test_comment_is_saved_even_if_publishing_fails(client, db, student_headers, clean_tickets, monkeypatch):
+    ticket_id = _ticket(db)
+
+    async def broken_publish(channel, payload):
+        raise ConnectionError("broker connection is down")
+    monkeypatch.setattr(broker, "publish", broken_publish)
+
+    response = client.post(f"/tickets/{ticket_id}/comments/", json={"content": "kept"}, headers=student_headers)
+    assert response.status_code == 200
+    assert db.query(models.Comment).filter(models.Comment.id == response.json()["id"]).count() == 1
+
+
+def test_comment_events_replay_then_push_each_comment_once(client, db, clean_tickets):
+    from routers.comments import comment_events
+    ticket_id = _ticket(db)
+    stored = models.Comment(content="x" * 10, ticket_id=ticket_id, author_id=1)
+    db.add(stored)
+    db.commit()
+
+    async def collect():
+        channel = f"ticket:{ticket_id}"
+        queue = broker.subscribe(channel)
+        replayed = {"id": stored.id - 1, "content": "old"}
+        await broker.publish(channel, json.dumps(replayed))
+        await broker.publish(channel, json.dumps({"id": stored.id, "ticket_id": ticket_id}))  # id only
+        backlog = [replayed]
+        return [event async for event in comment_events(_Request(polls=2), channel, queue, backlog, caller=1)]
+
+    events = client.portal.call(collect)
+    assert events[0].startswith(f"id: {stored.id - 1}\nevent: comment\n")
+    assert len(events) == 2
+    pushed = json.loads(events[1].split("data: ", 1)[1])
+    assert pushed["id"] == stored.id and pushed["content"] == "x" * 10
+    assert broker.subscriber_count() == 0
+
+
+def test_comment_events_push_a_lower_id_that_commits_late(client, db, clean_tickets):
+    from routers.comments import comment_events
+    ticket_id = _ticket(db)
+
+    async def collect():
+        channel = f"ticket:{ticket_id}"
+        queue = broker.subscribe(channel)
+        # id 8 committed after id 9 was replayed: it must still reach the client
+        await broker.publish(channel, json.dumps({"id": 9, "content": "replayed"}))
+        await broker.publish(channel, json.dumps({"id": 8, "content": "late"}))
+        backlog = [{"id": 9, "content": "replayed"}]
+        return [event async for event in comment_events(_Request(polls=2), channel, queue, backlog, caller=1)]
+
+    events = client.portal.call(collect)
+    assert [json.loads(event.split("data: ", 1)[1])["id"] for event in events] == [9, 8]
+    assert broker.subscriber_count() == 0
+
+
+def test_slow_subscriber_is_cut_off(monkeypatch):
+    import asyncio
+    import broker as broker_module
+    monkeypatch.setattr(broker_module, "BROKER_QUEUE_SIZE", 2)
+
+    async def run():
+        local = InProcessBroker()
+        slow = local.subscribe("c")
+        for i in range(3):
+            await local.publish("c", str(i))
+        return [slow.get_nowait() for _ in range(slow.qsize())], local.subscriber_count()
+
+    assert asyncio.run(run()) == ([None], 0)
+
+
+def test_broker_is_abstract():
+    from broker import Broker
+    with pytest.raises(TypeError):
+        Broker()
+
+
+def test_postgres_broker_cuts_subscribers_off_and_reconnects(monkeypatch):
+    import asyncio
+    from broker import PostgresBroker
+
+    class FakeConnection:
+        def is_closed(self):
+            return False
+
+    async def run():
+        pg = PostgresBroker("postgresql://unused")
+        attempts = []
+
+        async def connect():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise OSError("still down")
+            pg._conn = FakeConnection()
+        monkeypatch.setattr(pg, "_connect", connect)
+        monkeypatch.setattr(asyncio, "sleep", lambda delay, _sleep=asyncio.sleep: _sleep(0))
+
+        lost = pg._conn = FakeConnection()
+        queue = pg.subscribe("ticket:1")
+        pg._on_lost(lost)
+        assert queue.get_nowait() is None and pg.subscriber_count() == 0
+        with pytest.raises(ConnectionError):
+            await pg.publish("ticket:1", "{}")
+        while pg._reconnect is not None:
+            await asyncio.sleep(0)
+        return len(attempts), pg._conn
+
+    attempts, conn = asyncio.run(run())
+    assert attempts == 2 and conn is not None
+
+
+def test_stream_checks_ticket_access(client, db, student_headers, clean_tickets):
+    ticket_id = _ticket(db, "teacher@helpdesk.com")
+    assert client.get(f"/tickets/{ticket_id}/comments/stream", headers=student_headers).status_code == 403
+    assert client.get("/tickets/999999/comments/stream", headers=student_headers).status_code == 404
+
+
+def test_comment_thread_pages_oldest_first(client, db, student_headers, clean_tickets):
+    import datetime
+    ticket_id = _ticket(db)
+    start = datetime.datetime(2024, 1, 1)
+    for i in range(7):
+        db.add(models.Comment(content=f"c{i}", ticket_id=ticket_id, author_id=1,
+                              created_at=start + datetime.timedelta(minutes=i // 2)))
+    db.commit()
+    url = f"/tickets/{ticket_id}/comments/"
+
+    seen, cursor = [], ""
+    while cursor is not None:
+        page = client.get(url, params={"cursor": cursor, "limit": 3}, headers=student_headers).json()
+        seen += page["items"]
+        cursor = page["next_cursor"]
+    assert [c["content"] for c in seen] == [f"c{i}" for i in range(7)]
+
+    # Incremental fetch: only what came after the last comment the client has
+    newer = client.get(url, params={"after": seen[4]["id"]}, headers=student_headers).json()
+    assert [c["content"] for c in newer["items"]] == ["c5", "c6"]
+    assert len(client.get(url, params={"after": 0}, headers=student_headers).json()["items"]) == 7
+    # No paging parameters: a plain list, bounded by limit
+    assert [c["content"] for c in client.get(url, params={"limit": 2}, headers=student_headers).json()] == ["c0", "c1"]
+
+
+def test_comment_indexes_are_added_to_an_existing_database(app):
+    import database
+    from sqlalchemy import inspect, text
+    with database.engine.begin() as conn:
+        for index in models.Comment.__table__.indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    database.ensure_indexes(database.engine, models.Comment.__table__)
+    names = {index["name"] for index in inspect(database.engine).get_indexes("comments")}
+    assert {"ix_comments_ticket_id_created_at", "ix_comments_author_id"} <= names
+
+
+def test_comment_thread_walks_the_ticket_index(app, db):
+    import database
+    from sqlalchemy import select, text
+    from pagination import keyset_page
+    from routers.comments import comments_after
+    if database.engine.dialect.name != "sqlite":
+        pytest.skip("reads the SQLite query plan")
+
+    stmt = comments_after(select(models.Comment).where(models.Comment.ticket_id == 1), 1, 5)
+    stmt = keyset_page(stmt, (models.Comment.created_at, models.Comment.id), None, 50, (), descending=False)
+    sql = str(stmt.compile(database.engine, compile_kwargs={"literal_binds": True}))
+    plan = " ".join(row[-1] for row in db.execute(text("EXPLAIN QUERY PLAN " + sql)))
+    assert "ix_comments_ticket_id_created_at" in plan and "TEMP B-TREE" not in plan
@@ -0,0 +1,526 @@
+import asyncio
+import datetime
+
+import pytest
+from sqlalchemy import delete, inspect, text
+
+import database
+import models
+from conftest import count_queries, query_budget, seed_commented_tickets
+
+
+def _seed_tickets(db, owner_email, count):
+    owner = db.query(models.User).filter(models.User.email == owner_email).first()
+    start = datetime.datetime(2024, 1, 1)
+    for i in range(count):
+        db.add(models.Ticket(
+            title=f"Ticket {i}",
+            description="seeded",
+            category="student",
+            owner_id=owner.id,
+            created_at=start + datetime.timedelta(minutes=i // 2),  # pairs share a timestamp
+        ))
+    db.commit()
+
+
+def test_cursor_pagination_walks_every_ticket_once(client, db, admin_headers, clean_tickets):
+    _seed_tickets(db, "student@helpdesk.com", 25)
+
+    seen, cursor = [], ""
+    while cursor is not None:
+        response = client.get("/tickets", params={"cursor": cursor, "limit": 10}, headers=admin_headers)
+        assert response.status_code == 200
+        page = response.json()
+        seen.extend(ticket["id"] for ticket in page["items"])
+        cursor = page["next_cursor"]
+
+    assert len(seen) == 25
+    assert len(set(seen)) == 25
+    keys = [(t.created_at, t.id) for t in db.query(models.Ticket).filter(models.Ticket.id.in_(seen))]
+    assert [k[1] for k in sorted(keys, reverse=True)] == seen
+
+
+def test_cursor_pagination_is_stable_under_inserts(client, db, admin_headers, clean_tickets):
+    _seed_tickets(db, "student@helpdesk.com", 6)
+
+    first = client.get("/tickets", params={"cursor": "", "limit": 3}, headers=admin_headers).json()
+    _seed_tickets(db, "student@helpdesk.com", 2)  # older rows would shift an offset page
+    db.add(models.Ticket(title="New", description="x", category="student"))
+    db.commit()
+    second = client.get("/tickets", params={"cursor": first["next_cursor"], "limit": 3}, headers=admin_headers).json()
+
+    first_ids = {t["id"] for t in first["items"]}
+    assert not first_ids & {t["id"] for t in second["items"]}
+
+
+def test_keyset_index_is_added_to_an_existing_database(app, db):
+    # create_all skipped the table on databases created before the index existed
+    with database.engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_tickets_created_at_id"))
+    database.ensure_indexes(database.engine, models.Ticket.__table__)
+    database.ensure_indexes(database.engine, models.Ticket.__table__)  # idempotent
+    names = {index["name"] for index in inspect(database.engine).get_indexes("tickets")}
+    assert "ix_tickets_created_at_id" in names
+
+
+def test_offset_pagination_still_returns_a_list(client, db, student_headers, clean_tickets):
+    _seed_tickets(db, "student@helpdesk.com", 3)
+    response = client.get("/tickets", params={"skip": 1, "limit": 5}, headers=student_headers)
+    assert response.status_code == 200
+    assert isinstance(response.json(), list)
+    assert len(response.json()) == 2
+
+
+@pytest.mark.parametrize("path", ["/tickets", "/tickets/summary", "/me/tickets"])
+@pytest.mark.parametrize("limit", [0, -1, 501])
+def test_out_of_range_limit_is_rejected(client, db, student_headers, clean_tickets, path, limit):
+    _seed_tickets(db, "student@helpdesk.com", 1)
+    response = client.get(path, params={"cursor": "", "limit": limit}, headers=student_headers)
+    assert response.status_code == 422
+
+
+def test_listing_dependencies_stay_off_the_threadpool(app):
+    import inspect as pyinspect
+
+    def calls(dependant):
+        for dependency in dependant.dependencies:
+            yield dependency.call
+            yield from calls(dependency)
+
+    listings = {"/tickets", "/tickets/summary", "/tickets/export", "/audit/", "/audit/export"}
+    routes = [
+        route for route in app.routes
+        if getattr(route, "path", None) in listings and "GET" in route.methods
+    ]
+    assert len(routes) == len(listings)
+    for route in routes:
+        for call in calls(route.dependant):
+            assert pyinspect.iscoroutinefunction(call) or pyinspect.isasyncgenfunction(call) \
+                or pyinspect.iscoroutinefunction(getattr(call, "__call__", None)), (route.path, call)
+
+
+def test_invalid_cursor_is_rejected(client, admin_headers):
+    response = client.get("/tickets", params={"cursor": "not-a-cursor"}, headers=admin_headers)
+    assert response.status_code == 400
+
+
+def test_filters_are_applied_server_side(client, db, admin_headers, clean_tickets):
+    student = db.query(models.User).filter(models.User.email == "student@helpdesk.com").first()
+    teacher = db.query(models.User).filter(models.User.email == "teacher@helpdesk.com").first()
+    db.add_all([
+        models.Ticket(title="a", description="d", category="student", status="open", priority="high",
+                      owner_id=student.id, created_at=datetime.datetime(2024, 1, 1)),
+        models.Ticket(title="b", description="d", category="student", status="resolved", priority="low",
+                      owner_id=student.id, created_at=datetime.datetime(2024, 2, 1)),
+        models.Ticket(title="c", description="d", category="teacher", status="open", priority="high",
+                      owner_id=teacher.id, created_at=datetime.datetime(2024, 3, 1)),
+    ])
+    db.commit()
+
+    def titles(**params):
+        response = client.get("/tickets", params=params, headers=admin_headers)
+        assert response.status_code == 200
+        return sorted(t["title"] for t in response.json())
+
+    assert titles(status="open") == ["a", "c"]
+    assert titles(priority="low") == ["b"]
+    assert titles(category="teacher") == ["c"]
+    assert titles(owner_role="student") == ["a", "b"]
+    assert titles(owner_role="teacher", status="open") == ["c"]
+    assert titles(created_after="2024-01-15T00:00:00", created_before="2024-03-01T00:00:00") == ["b"]
+
+
+@pytest.mark.parametrize("column", ["status", "priority", "category", "owner_id"])
+def test_filtered_page_walks_its_index(app, db, column):
+    from pagination import keyset_page
+    from sqlalchemy import select
+    if database.engine.dialect.name != "sqlite":
+        pytest.skip("reads the SQLite query plan")
+
+    stmt = select(models.Ticket).where(getattr(models.Ticket, column) == (1 if column == "owner_id" else "x"))
+    stmt = keyset_page(stmt, (models.Ticket.created_at, models.Ticket.id), None, 20, ())
+    sql = str(stmt.compile(database.engine, compile_kwargs={"literal_binds": True}))
+    plan = " ".join(row[-1] for row in db.execute(text("EXPLAIN QUERY PLAN " + sql)))
+    assert f"ix_tickets_{column}_created_at" in plan and "TEMP B-TREE" not in plan
+
+
+def test_ticket_page_uses_a_constant_number_of_queries(client, db, admin_headers, clean_tickets):
+    seed_commented_tickets(db, 2)
+    with count_queries() as small:
+        response = client.get("/tickets", headers=admin_headers)
+    assert len(response.json()) == 2
+    assert all(len(t["comments"]) == 2 and t["owner"] for t in response.json())
+
+    seed_commented_tickets(db, 40)
+    with count_queries() as large:
+        response = client.get("/tickets", headers=admin_headers)
+    assert len(response.json()) == 42
+
+    # principal lookup + list version + tickets + owners + comments, whatever the page size
+    assert len(large) == len(small) == 5
+
+
+def test_ticket_detail_and_writes_eager_load(client, db, admin_headers, clean_tickets):
+    seed_commented_tickets(db, 1)
+    ticket_id = db.query(models.Ticket.id).scalar()
+
+    with count_queries() as detail:
+        response = client.get(f"/tickets/{ticket_id}", headers=admin_headers)
+    assert len(response.json()["comments"]) == 2
+    assert len(detail) == 5  # principal + version probe + ticket + owner + comments
+
+    with count_queries() as update:
+        response = client.patch(f"/tickets/{ticket_id}", params={"status": "resolved"}, headers=admin_headers)
+    assert response.json()["status"] == "resolved"
+    assert not [s for s in update if "FROM comments" in s and "IN (" not in s]
+
+
+def test_summary_projection_counts_comments_in_sql(client, db, student_headers, clean_tickets):
+    seed_commented_tickets(db, 3)
+
+    with count_queries() as queries:
+        response = client.get("/tickets/summary", headers=student_headers)
+    assert response.status_code == 200
+    summaries = response.json()
+    assert len(summaries) == 3
+    assert all(s["comment_count"] == 2 for s in summaries)
+    assert "description" not in summaries[0] and "comments" not in summaries[0]
+    assert len(queries) == 3  # principal lookup + list version + one projected SELECT
+
+    page = client.get("/tickets/summary", params={"cursor": "", "limit": 2, "status": "open"},
+                      headers=student_headers).json()
+    assert len(page["items"]) == 2 and page["next_cursor"]
+
+
+def test_stats_follow_writes_without_counting_tickets(client, db, admin_headers, student_headers, clean_tickets):
+    for title in ("a", "b", "c"):
+        response = client.post("/tickets", json={"title": title, "description": "d", "category": "student"},
+                               headers=student_headers)
+        assert response.status_code == 200
+    ticket_id = response.json()["id"]
+    client.patch(f"/tickets/{ticket_id}", params={"status": "resolved"}, headers=admin_headers)
+    client.post("/tickets", json={"title": "x", "description": "d", "category": "admin", "priority": "high"},
+                headers=admin_headers)
+
+    with count_queries() as queries:
+        stats = client.get("/tickets/stats", headers=admin_headers).json()
+    assert not [q for q in queries if "FROM tickets" in q]
+    assert stats["total"] == 4
+    assert stats["by_status"] == {"open": 3, "resolved": 1}
+    assert stats["by_priority"] == {"medium": 3, "high": 1}
+    assert stats["by_owner_role"] == {"student": 3, "admin": 1}
+
+    mine = client.get("/tickets/stats", headers=student_headers).json()
+    assert mine["total"] == 3 and mine["by_category"] == {"student": 3}
+
+    client.delete(f"/tickets/{ticket_id}", headers=admin_headers)
+    stats = client.get("/tickets/stats", headers=admin_headers).json()
+    assert stats["total"] == 3 and stats["by_status"] == {"open": 3}
+
+    import ticket_stats
+    ticket_stats.rebuild(db)
+    assert client.get("/tickets/stats", headers=admin_headers).json() == stats
+
+
+def test_counter_rows_are_locked_in_one_order(monkeypatch):
+    import ticket_stats
+    bumped = []
+
+    async def fake_bump(db, scope, dimension, value, delta):
+        bumped.append((scope, dimension, value))
+    monkeypatch.setattr(ticket_stats, "_bump", fake_bump)
+
+    # Opposite changes on the same rows must take their locks in the same order
+    for old, new in (("open", "resolved"), ("resolved", "open")):
+        bumped.clear()
+        ticket = models.Ticket(owner_id=7, status=new)
+        asyncio.run(ticket_stats.record_status_change(None, ticket, old))
+        assert bumped == sorted(bumped) == [
+            (0, "status", "open"), (0, "status", "resolved"), (7, "status", "open"), (7, "status", "resolved"),
+        ]
+
+
+def test_search_ranks_pages_and_respects_visibility(client, db, admin_headers, student_headers, clean_tickets):
+    student = db.query(models.User).filter(models.User.email == "student@helpdesk.com").first()
+    teacher = db.query(models.User).filter(models.User.email == "teacher@helpdesk.com").first()
+    db.add_all([
+        models.Ticket(title="Imprimante en panne", description="L'imprimante du hall ne répond plus",
+                      category="student", owner_id=student.id),
+        models.Ticket(title="Wifi lent", description="Le wifi coupe, peut-être l'imprimante réseau",
+                      category="student", owner_id=student.id),
+        models.Ticket(title="Imprimante salle 12", description="Bourrage papier imprimante",
+                      category="teacher", owner_id=teacher.id),
+        models.Ticket(title="Mot de passe", description="Réinitialisation", category="student", owner_id=student.id),
+    ])
+    db.commit()
+
+    page = client.get("/tickets/search", params={"q": "imprimante", "limit": 2}, headers=admin_headers).json()
+    assert len(page["items"]) == 2 and page["next_cursor"]
+    ranks = [hit["rank"] for hit in page["items"]]
+    rest = client.get("/tickets/search", params={"q": "imprimante", "limit": 2, "cursor": page["next_cursor"]},
+                      headers=admin_headers).json()
+    assert len(rest["items"]) == 1 and rest["next_cursor"] is None
+    assert ranks == sorted(ranks, reverse=True) and ranks[-1] >= rest["items"][0]["rank"]
+    assert rest["items"][0]["title"] == "Wifi lent"  # only mentions the term once, in the description
+
+    mine = client.get("/tickets/search", params={"q": "imprimante"}, headers=student_headers).json()
+    assert sorted(hit["title"] for hit in mine["items"]) == ["Imprimante en panne", "Wifi lent"]
+
+    # Accents are folded and FTS syntax in user input is treated as plain text
+    assert client.get("/tickets/search", params={"q": "reinitialisation"}, headers=admin_headers).json()["items"]
+    assert client.get("/tickets/search", params={"q": 'NEAR("x" AND'}, headers=admin_headers).status_code == 200
+
+    ticket = db.query(models.Ticket).filter(models.Ticket.title == "Mot de passe").one()
+    ticket.title = "Clavier cassé"
+    db.commit()
+    assert client.get("/tickets/search", params={"q": "clavier"}, headers=admin_headers).json()["items"]
+
+
+def test_conditional_get_answers_304_until_the_ticket_changes(client, db, admin_headers, student_headers, clean_tickets):
+    seed_commented_tickets(db, 2)
+    ticket_id = db.query(models.Ticket.id).first()[0]
+    url = f"/tickets/{ticket_id}"
+
+    first = client.get(url, headers=student_headers)
+    etag = first.headers["etag"]
+    with count_queries() as queries:
+        cached = client.get(url, headers={**student_headers, "If-None-Match": etag})
+    assert cached.status_code == 304 and not cached.content
+    assert len(queries) == 2  # principal lookup + version probe, nothing loaded
+    listing = client.get("/tickets", headers=student_headers).headers["etag"]
+    comments = client.get(f"{url}/comments/", headers=student_headers).headers["etag"]
+    assert client.get("/tickets", headers={**student_headers, "If-None-Match": listing}).status_code == 304
+
+    # A comment bumps the ticket's version: detail, list and thread all change
+    client.post(f"{url}/comments/", json={"content": "new"}, headers=student_headers)
+    refreshed = client.get(url, headers={**student_headers, "If-None-Match": etag})
+    assert refreshed.status_code == 200 and refreshed.headers["etag"] != etag
+    assert client.get("/tickets", headers={**student_headers, "If-None-Match": listing}).status_code == 200
+    assert client.get(f"{url}/comments/", headers={**student_headers, "If-None-Match": comments}).status_code == 200
+
+    # So does a status change, and the list ETag depends on the viewer and query
+    client.patch(url, params={"status": "resolved"}, headers=admin_headers)
+    assert client.get(url, headers={**student_headers, "If-None-Match": refreshed.headers["etag"]}).status_code == 200
+    assert client.get("/tickets?status=open", headers=student_headers).headers["etag"] != listing
+    assert client.get("/tickets", headers=admin_headers).headers["etag"] != listing
+
+
+def test_list_etag_is_one_primary_key_lookup(client, db, admin_headers, student_headers, clean_tickets):
+    seed_commented_tickets(db, 3)
+    admin_list = client.get("/tickets", headers=admin_headers).headers["etag"]
+    student_list = client.get("/tickets", headers=student_headers).headers["etag"]
+
+    with count_queries() as queries:
+        assert client.get("/tickets?cursor=&limit=5", headers=admin_headers).status_code == 200
+    probe = [q for q in queries if "ticket_list_versions" in q]
+    assert len(probe) == 1 and "WHERE ticket_list_versions.scope = " in probe[0]
+    assert not [q for q in queries if "count(" in q.lower()]
+
+    # Writes to another owner's tickets leave the student's list ETag alone
+    created = client.post("/tickets", json={"title": "t", "description": "d", "category": "admin"}, headers=admin_headers)
+    assert client.get("/tickets", headers={**student_headers, "If-None-Match": student_list}).status_code == 304
+    assert client.get("/tickets", headers={**admin_headers, "If-None-Match": admin_list}).status_code == 200
+
+    # Deleting one of the student's tickets changes both
+    admin_list = client.get("/tickets", headers=admin_headers).headers["etag"]
+    mine = client.get("/tickets", headers=student_headers).json()[0]["id"]
+    client.delete(f"/tickets/{mine}", headers=admin_headers)
+    assert client.get("/tickets", headers={**student_headers, "If-None-Match": student_list}).status_code == 200
+    assert client.get("/tickets", headers={**admin_headers, "If-None-Match": admin_list}).status_code == 200
+    assert created.status_code == 200
+
+
+def test_ticket_detail_cache_is_checked_and_invalidated(client, db, admin_headers, student_headers, clean_tickets, monkeypatch):
+    import ticket_cache
+    from cache import TTLCache
+    monkeypatch.setattr(ticket_cache, "ticket_cache", TTLCache(
+        maxsize=100, ttl=60, maxbytes=1 << 20, sizeof=lambda entry: len(entry.payload),
+        is_placeholder=lambda entry: not entry.payload,
+    ))
+    seed_commented_tickets(db, 1)
+    seed_commented_tickets(db, 1, owner_email="teacher@helpdesk.com")
+    owned = {t.owner.email: t.id for t in db.query(models.Ticket)}
+    mine, theirs = owned["student@helpdesk.com"], owned["teacher@helpdesk.com"]
+    url = f"/tickets/{mine}"
+
+    first = client.get(url, headers=student_headers).json()
+    with count_queries() as queries:
+        assert client.get(url, headers=student_headers).json() == first
+    assert len(queries) == 1  # principal lookup only
+
+    # Authorization runs against the cached owner
+    client.get(f"/tickets/{theirs}", headers=admin_headers)
+    with count_queries() as queries:
+        assert client.get(f"/tickets/{theirs}", headers=student_headers).status_code == 403
+    assert len(queries) == 1
+
+    client.post(f"{url}/comments/", json={"content": "third"}, headers=student_headers)
+    assert len(client.get(url, headers=student_headers).json()["comments"]) == 3
+    client.patch(url, params={"status": "resolved"}, headers=admin_headers)
+    with count_queries() as queries:
+        assert client.get(url, headers=student_headers).json()["status"] == "resolved"
+    assert len(queries) == 1  # write-through: the PATCH refreshed the entry
+    client.delete(url, headers=admin_headers)
+    assert client.get(url, headers=student_headers).status_code == 404
+
+    stats = client.get("/admin/cache-stats", headers=admin_headers).json()["tickets"]
+    assert stats["hits"] >= 3 and stats["misses"] >= 3 and 0 < stats["bytes"] <= stats["maxbytes"]
+
+
+def test_ticket_deleted_before_the_load_is_not_found(client, db, student_headers, clean_tickets, monkeypatch):
+    import main
+    seed_commented_tickets(db, 1)
+    ticket_id = db.query(models.Ticket.id).scalar()
+    load_ticket = main.load_ticket
+
+    async def deleted_meanwhile(session, ticket_id):
+        await session.execute(delete(models.Ticket).where(models.Ticket.id == ticket_id))
+        return await load_ticket(session, ticket_id)
+
+    monkeypatch.setattr(main, "load_ticket", deleted_meanwhile)
+    assert client.get(f"/tickets/{ticket_id}", headers=student_headers).status_code == 404
+
+
+def test_ticket_cache_never_goes_back_to_an_older_version(client, monkeypatch):
+    import ticket_cache
+    from cache import TTLCache
+    monkeypatch.setattr(ticket_cache, "ticket_cache", TTLCache(
+        maxsize=10, ttl=60, maxbytes=10_000, sizeof=lambda e: len(e.payload), is_placeholder=lambda e: not e.payload,
+    ))
+    put = lambda version: ticket_cache._put(7, ticket_cache.CachedTicket(owner_id=1, version=version, payload=b"{}"))
+
+    put(3)
+    put(2)  # a slow load that read before the last write
+    assert ticket_cache.lookup(7).version == 3
+
+    # A write's tombstone: gone for readers, and loads of older versions are refused
+    client.portal.call(ticket_cache.invalidate, 7, 4)
+    assert ticket_cache.lookup(7) is None
+    put(3)
+    assert ticket_cache.lookup(7) is None
+    put(4)
+    assert ticket_cache.lookup(7).version == 4
+
+    client.portal.call(ticket_cache.invalidate, 7, ticket_cache.DELETED)
+    put(5)
+    assert ticket_cache.lookup(7) is None
+
+
+def test_ticket_cache_is_filled_from_the_primary(client, db, student_headers, clean_tickets, monkeypatch):
+    import shutil
+    import ticket_cache
+    from cache import TTLCache
+    if database.engine.dialect.name != "sqlite":
+        pytest.skip("builds the replica by copying the SQLite file")
+    monkeypatch.setattr(ticket_cache, "ticket_cache", TTLCache(
+        maxsize=10, ttl=60, maxbytes=1 << 20, sizeof=lambda e: len(e.payload), is_placeholder=lambda e: not e.payload,
+    ))
+    seed_commented_tickets(db, 1)
+    ticket = db.query(models.Ticket).one()
+
+    # The replica lags: it misses the last write to the ticket
+    replica_path = database.engine.url.database + ".replica"
+    shutil.copyfile(database.engine.url.database, replica_path)
+    ticket.title, ticket.version = "after the write", ticket.version + 1
+    db.commit()
+    database.configure_replicas([f"sqlite:///{replica_path}"])
+    monkeypatch.setattr(database, "_recent_writers", {})
+    try:
+        assert client.get(f"/tickets/{ticket.id}", headers=student_headers).json()["title"] == "after the write"
+        assert ticket_cache.lookup(ticket.id).version == ticket.version
+    finally:
+        database.configure_replicas([])
+
+
+def test_ticket_cache_drops_entries_invalidated_by_other_processes(client, monkeypatch):
+    import ticket_cache
+    from broker import broker
+    from cache import TTLCache
+    monkeypatch.setattr(ticket_cache, "ticket_cache", TTLCache(
+        maxsize=10, ttl=60, maxbytes=1000, sizeof=lambda e: len(e.payload), is_placeholder=lambda e: not e.payload,
+    ))
+    entry = ticket_cache.CachedTicket(owner_id=1, version=1, payload=b"{}")
+    ticket_cache.ticket_cache.set(7, entry)
+    ticket_cache.ticket_cache.set(8, entry)
+
+    async def run():
+        ticket_cache.start()
+        await asyncio.sleep(0)
+        await broker.publish(ticket_cache.CHANNEL, f"{ticket_cache._origin}:8")  # our own: ignored
+        await broker.publish(ticket_cache.CHANNEL, "another-worker:7")
+        await asyncio.sleep(0)
+        await ticket_cache.stop()
+
+    client.portal.call(run)
+    assert ticket_cache.lookup(7) is None and ticket_cache.lookup(8) == entry
+
+
+# Queries each read route may issue, whatever the number of rows (N+1 guard)
+ROUTE_QUERY_BUDGETS = [
+    ("/tickets", 5),           # principal, list version, tickets, owners, comments
+    ("/tickets?cursor=", 5),
+    ("/tickets/summary", 3),   # principal, list version, projection
+    ("/tickets/stats", 2),     # principal, counters
+    ("/tickets/{id}", 5),      # principal, version probe, ticket, owner, comments
+    ("/tickets/{id}/comments/", 3),
+    ("/audit/", 2),
+    ("/me", 1),
+]
+
+
+@pytest.mark.parametrize("path, budget", ROUTE_QUERY_BUDGETS)
+def test_read_routes_stay_within_their_query_budget(client, db, admin_headers, clean_tickets, path, budget):
+    seed_commented_tickets(db, 20)
+    ticket_id = db.query(models.Ticket.id).first()[0]
+    with query_budget(budget):
+        response = client.get(path.format(id=ticket_id), headers=admin_headers)
+    assert response.status_code == 200
+
+
+def test_server_timing_reports_the_sql_profile(client, admin_headers):
+    import re
+    response = client.get("/tickets", headers=admin_headers)
+    timing = response.headers["server-timing"]
+    match = re.match(r'db;dur=([\d.]+);desc="(\d+) queries", db-slowest;dur=([\d.]+)$', timing)
+    assert match and int(match.group(2)) == 5
+    assert float(match.group(3)) <= float(match.group(1))
+
+
+def test_query_budget_catches_an_n_plus_one(client, db, admin_headers, clean_tickets):
+    seed_commented_tickets(db, 3)
+    with pytest.raises(AssertionError, match="queries for a budget of 2"):
+        with query_budget(2):
+            for ticket in client.get("/tickets/summary", headers=admin_headers).json():
+                client.get(f"/tickets/{ticket['id']}/comments/", headers=admin_headers)
+
+
+def test_export_streams_visible_tickets(client, db, admin_headers, student_headers, clean_tickets):
+    import csv, io, json
+    _seed_tickets(db, "student@helpdesk.com", 3)
+    _seed_tickets(db, "teacher@helpdesk.com", 2)
+
+    response = client.get("/tickets/export", headers=student_headers)
+    assert response.headers["content-type"].startswith("text/csv")
+    assert 'filename="tickets.csv"' in response.headers["content-disposition"]
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 3 and {row["owner_id"] for row in rows} == {rows[0]["owner_id"]}
+
+    response = client.get("/tickets/export", params={"format": "ndjson", "owner_role": "teacher"}, headers=admin_headers)
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 2 and set(lines[0]) >= {"id", "title", "status", "created_at"}
+    assert [l["created_at"] for l in lines] == sorted((l["created_at"] for l in lines), reverse=True)
+
+    assert client.get("/tickets/export", params={"format": "xml"}, headers=admin_headers).status_code == 422
+
+
+def test_second_session_in_a_request_scope_is_rejected():
+    with database.request_scope():
+        first = database.SessionLocal()
+        first.execute(text("SELECT 1"))
+        first.commit()
+        first.execute(text("SELECT 1"))  # a new transaction on the same session is fine
+        second = database.SessionLocal()
+        with pytest.raises(database.MultipleSessionsError):
+            second.execute(text("SELECT 1"))
+        first.close()
+        second.close()
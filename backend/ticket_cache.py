@@ -0,0 +1,126 @@
+"""
+In-process cache of serialized GET /tickets/{id} payloads.
+
+Entries hold the JSON bytes together with the ticket's owner_id (authorization runs
+against it on every hit) and version (the ETag). The cache is bounded by entry
+count and by TICKET_CACHE_MAXBYTES of payload.
+
+Entries are only filled from the primary, never from a lagging replica, and never
+replace an entry of a higher version. Writers update the entry after their commit
+(`store`, write-through) or replace it with a tombstone carrying the new version
+(`invalidate`), so a load that started before the write cannot cache the older copy
+afterwards. Invalidations also go out on the broker channel CHANNEL, so
+with COMMENT_BROKER=postgres the other workers and nodes drop their copy too.
+With the in-process broker, other workers only converge after
+TICKET_CACHE_TTL_SECONDS.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import sys
+import uuid
+from dataclasses import dataclass
+
+import schemas
+from broker import broker
+from cache import TTLCache
+
+TICKET_CACHE_TTL_SECONDS = float(os.getenv("TICKET_CACHE_TTL_SECONDS", "300"))
+TICKET_CACHE_MAXSIZE = int(os.getenv("TICKET_CACHE_MAXSIZE", "10000"))
+TICKET_CACHE_MAXBYTES = int(os.getenv("TICKET_CACHE_MAXBYTES", str(64 * 1024 * 1024)))
+
+CHANNEL = "cache:tickets"
+# Tombstone version left by a delete: no load can replace it
+DELETED = sys.maxsize
+logger = logging.getLogger(__name__)
+# Lets the bus listener skip this process's own invalidations
+_origin = uuid.uuid4().hex
+_listener = None
+
+
+@dataclass(frozen=True)
+class CachedTicket:
+    owner_id: int
+    version: int
+    payload: bytes  # empty for a tombstone
+
+
+ticket_cache = TTLCache(
+    maxsize=TICKET_CACHE_MAXSIZE,
+    ttl=TICKET_CACHE_TTL_SECONDS,
+    maxbytes=TICKET_CACHE_MAXBYTES,
+    sizeof=lambda entry: len(entry.payload),
+    is_placeholder=lambda entry: not entry.payload,
+)
+
+
+def lookup(ticket_id: int):
+    return ticket_cache.get(ticket_id)
+
+
+def _put(ticket_id: int, entry: CachedTicket):
+    ticket_cache.set(ticket_id, entry, unless=lambda current: current.version > entry.version)
+
+
+def store(ticket) -> CachedTicket:
+    """Serialize a fully loaded ticket (owner and comments), read from the primary, and cache it."""
+    entry = CachedTicket(
+        owner_id=ticket.owner_id,
+        version=ticket.version,
+        payload=schemas.Ticket.model_validate(ticket, from_attributes=True).model_dump_json().encode(),
+    )
+    _put(ticket.id, entry)
+    return entry
+
+
+def _forget(ticket_id: int, version):
+    if version is None:
+        ticket_cache.invalidate(ticket_id)
+    else:
+        _put(ticket_id, CachedTicket(owner_id=0, version=version, payload=b""))
+
+
+async def invalidate(ticket_id: int, version: int = None, keep_local: bool = False):
+    """
+    Drop the ticket here (unless write-through just refreshed it) and on every other
+    process. `version` is the ticket's version after the write (DELETED for a delete).
+    """
+    if not keep_local:
+        _forget(ticket_id, version)
+    if ticket_cache.enabled:
+        try:
+            await broker.publish(CHANNEL, f"{_origin}:{ticket_id}:{'' if version is None else version}")
+        except Exception:
+            # Called after the commit: other processes converge after TICKET_CACHE_TTL_SECONDS
+            logger.exception("Could not broadcast the invalidation of ticket %s", ticket_id)
+
+
+async def _listen():
+    while True:
+        queue = broker.subscribe(CHANNEL)
+        try:
+            while (message := await queue.get()) is not None:
+                origin, _, rest = message.partition(":")
+                ticket_id, _, version = rest.partition(":")
+                if origin != _origin:
+                    _forget(int(ticket_id), int(version) if version else None)
+        finally:
+            broker.unsubscribe(CHANNEL, queue)
+        # Cut off by the broker: invalidations may have been missed
+        ticket_cache.clear()
+
+
+def start():
+    global _listener
+    if _listener is None and ticket_cache.enabled:
+        _listener = asyncio.create_task(_listen())
+
+
+async def stop():
+    global _listener
+    if _listener is not None:
+        _listener.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _listener
+        _listener = None
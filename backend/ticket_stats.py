@@ -0,0 +1,161 @@
+"""
+Ticket statistics served from pre-aggregated counters.
+
+Every write that changes a ticket's status, priority, category or ownership adjusts
+the matching rows of `ticket_counters` in the same transaction as the change, so
+reading the dashboard numbers is a handful of primary-key lookups instead of a
+COUNT(*) over the tickets table. Counters are kept for the whole table (scope 0)
+and per owner, so non-admin users get their own numbers for the same price.
+"""
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+
+GLOBAL_SCOPE = 0
+DIMENSIONS = ("status", "priority", "category", "owner_role")
+NO_VALUE = "none"
+
+
+def _keys(status, priority, category, owner_role):
+    return {
+        "status": status or NO_VALUE,
+        "priority": priority or NO_VALUE,
+        "category": category or NO_VALUE,
+        "owner_role": owner_role or NO_VALUE,
+    }
+
+
+def _scopes(owner_id):
+    return (GLOBAL_SCOPE, owner_id) if owner_id else (GLOBAL_SCOPE,)
+
+
+async def _bump(db: AsyncSession, scope: int, dimension: str, value: str, delta: int):
+    counter = models.TicketCounter
+    matches = (
+        (counter.scope == scope)
+        & (counter.dimension == dimension)
+        & (counter.value == value)
+    )
+    result = await db.execute(update(counter).where(matches).values(count=counter.count + delta))
+    if result.rowcount:
+        return
+
+    # First ticket for this (scope, dimension, value): create the row. A concurrent
+    # writer may win the race, in which case its row now exists and we update it.
+    # Flush pending changes first so a rolled-back savepoint only discards the counter.
+    await db.flush()
+    try:
+        async with db.begin_nested():
+            db.add(counter(scope=scope, dimension=dimension, value=value, count=delta))
+    except IntegrityError:
+        await db.execute(update(counter).where(matches).values(count=counter.count + delta))
+
+
+async def _apply(db: AsyncSession, bumps):
+    """Apply (scope, dimension, value, delta) bumps in lock order."""
+    for scope, dimension, value, delta in sorted(bumps):
+        await _bump(db, scope, dimension, value, delta)
+
+
+async def _adjust(db: AsyncSession, owner_id, keys: dict, delta: int):
+    await _apply(db, [
+        (scope, dimension, value, delta)
+        for scope in _scopes(owner_id)
+        for dimension, value in keys.items()
+    ])
+
+
+async def record_created(db: AsyncSession, ticket: models.Ticket, owner_role: str):
+    """Count a new ticket. Call before the commit that inserts it."""
+    keys = _keys(ticket.status or models.TicketStatus.OPEN.value,
+                 ticket.priority or models.TicketPriority.MEDIUM.value,
+                 ticket.category, owner_role)
+    await _adjust(db, ticket.owner_id, keys, +1)
+
+
+async def record_deleted(db: AsyncSession, ticket: models.Ticket, owner_role: str):
+    """Uncount a ticket. Call before the commit that deletes it."""
+    await _adjust(db, ticket.owner_id, _keys(ticket.status, ticket.priority, ticket.category, owner_role), -1)
+
+
+async def record_status_change(db: AsyncSession, ticket: models.Ticket, old_status: str):
+    """Move a ticket between status buckets. Call before the commit that updates it."""
+    if old_status == ticket.status:
+        return
+    await _apply(db, [
+        bump
+        for scope in _scopes(ticket.owner_id)
+        for bump in ((scope, "status", old_status or NO_VALUE, -1), (scope, "status", ticket.status or NO_VALUE, +1))
+    ])
+
+
+async def read_stats(db: AsyncSession, owner_id=None) -> dict:
+    """
+    Return {"total": n, "by_status": {...}, "by_priority": {...}, ...} for the whole
+    table, or for one owner's tickets when owner_id is given.
+    """
+    scope = owner_id or GLOBAL_SCOPE
+    result = await db.execute(
+        select(models.TicketCounter.dimension, models.TicketCounter.value, models.TicketCounter.count)
+        .where(models.TicketCounter.scope == scope, models.TicketCounter.count != 0)
+    )
+    stats = {f"by_{dimension}": {} for dimension in DIMENSIONS}
+    for dimension, value, count in result.all():
+        stats[f"by_{dimension}"][value] = count
+    stats["total"] = sum(stats["by_status"].values())
+    return stats
+
+
+def rebuild(db: Session):
+    """
+    Recompute every counter from the tickets table. Needed only when tickets were
+    changed outside the API (seeding scripts, manual SQL); commits.
+
+    The owner_role counters are bucketed by the owner's role at write time. No API
+    route changes a user's role; after changing one by script or SQL, run this.
+    """
+    db.query(models.TicketCounter).delete()
+    owner_role = func.coalesce(models.User.role, NO_VALUE)
+    columns = {
+        "status": func.coalesce(models.Ticket.status, NO_VALUE),
+        "priority": func.coalesce(models.Ticket.priority, NO_VALUE),
+        "category": func.coalesce(models.Ticket.category, NO_VALUE),
+        "owner_role": owner_role,
+    }
+    for dimension, column in columns.items():
+        grouped = (
+            db.query(models.Ticket.owner_id, column, func.count(models.Ticket.id))
+            .outerjoin(models.Ticket.owner)
+            .group_by(models.Ticket.owner_id, column)
+            .all()
+        )
+        totals = {}
+        for owner_id, value, count in grouped:
+            totals[value] = totals.get(value, 0) + count
+            if owner_id:
+                db.add(models.TicketCounter(scope=owner_id, dimension=dimension, value=value, count=count))
+        for value, count in totals.items():
+            db.add(models.TicketCounter(scope=GLOBAL_SCOPE, dimension=dimension, value=value, count=count))
+    db.commit()
+
+
+def rebuild_if_empty():
+    db = SessionLocal()
+    try:
+        if db.query(models.TicketCounter.id).first() is None:
+            rebuild(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        rebuild(db)
+        print("Ticket counters rebuilt")
+    finally:
+        db.close()
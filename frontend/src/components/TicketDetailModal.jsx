@@ -13,9 +13,10 @@ export default function TicketDetailModal({ ticket, onClose }) {
     const messagesEndRef = useRef(null);
 
     useEffect(() => {
-        if (ticket) {
-            fetchComments();
-        }
+        if (!ticket) return;
+        const controller = new AbortController();
+        fetchComments().then(lastId => streamComments(controller.signal, lastId));
+        return () => controller.abort();
     }, [ticket]);
 
     useEffect(() => {
@@ -26,22 +27,67 @@ export default function TicketDetailModal({ ticket, onClose }) {
         messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
     };
 
+    // Fil paginé par curseur (du plus ancien au plus récent), page par page
     const fetchComments = async () => {
         try {
-            const response = await fetch(`/api/tickets/${ticket.id}/comments/`, {
-                headers: {
-                    'Authorization': `Bearer ${localStorage.getItem('token')}`
-                }
-            });
-            if (response.ok) {
+            let all = [];
+            let cursor = '';
+            while (cursor !== null) {
+                const response = await fetch(`/api/tickets/${ticket.id}/comments/?limit=100&cursor=${encodeURIComponent(cursor)}`, {
+                    headers: {
+                        'Authorization': `Bearer ${localStorage.getItem('token')}`
+                    }
+                });
+                if (!response.ok) return null;
                 const data = await response.json();
-                setComments(data);
+                all = [...all, ...data.items];
+                cursor = data.next_cursor;
             }
+            setComments(all);
+            return all.length ? all[all.length - 1].id : 0;
         } catch (error) {
             console.error('Error fetching comments:', error);
         } finally {
             setLoading(false);
         }
+        return null;
+    };
+
+    const appendComment = (comment) => {
+        setComments(prev => prev.some(c => c.id === comment.id) ? prev : [...prev, comment]);
+    };
+
+    // Flux SSE : le serveur pousse seulement les nouveaux commentaires. Last-Event-ID
+    // fait rejouer ceux publiés pendant une coupure.
+    const streamComments = async (signal, lastId) => {
+        while (!signal.aborted) {
+            try {
+                const headers = { 'Authorization': `Bearer ${localStorage.getItem('token')}` };
+                if (lastId !== null) headers['Last-Event-ID'] = String(lastId);
+                const response = await fetch(`/api/tickets/${ticket.id}/comments/stream`, { headers, signal });
+                if (!response.ok) return;
+                const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+                let buffer = '';
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += value;
+                    const events = buffer.split('\n\n');
+                    buffer = events.pop();
+                    for (const event of events) {
+                        const data = event.split('\n').find(line => line.startsWith('data: '));
+                        if (!data) continue;
+                        const comment = JSON.parse(data.slice(6));
+                        lastId = comment.id;
+                        appendComment(comment);
+                    }
+                }
+            } catch (error) {
+                if (signal.aborted) return;
+                console.error('Comment stream interrupted:', error);
+            }
+            await new Promise(resolve => setTimeout(resolve, 2000));
+        }
     };
 
     const handleSubmit = async (e) => {
@@ -51,7 +97,7 @@ export default function TicketDetailModal({ ticket, onClose }) {
         try {
             const comment = await addComment(ticket.id, newComment);
             if (comment) {
-                setComments([...comments, comment]);
+                appendComment(comment);
                 setNewComment('');
             }
         } catch (error) {
@@ -2,31 +2,94 @@ import React, { createContext, useContext, useState, useEffect } from 'react';
 
 const AuthContext = createContext();
 
+// Renew access tokens this long before they expire
+const REFRESH_MARGIN_MS = 5 * 60 * 1000;
+
 export function useAuth() {
     return useContext(AuthContext);
 }
 
+// Expiry of a JWT in seconds since the epoch, 0 if it cannot be read
+function tokenExpiry(jwt) {
+    try {
+        const payload = jwt.split('.')[1].replace(/-/g, '+').replace(/_/g, '/');
+        return JSON.parse(atob(payload)).exp || 0;
+    } catch {
+        return 0;
+    }
+}
+
+// One rotation at a time: presenting an already consumed refresh token revokes the whole login
+let refreshing = null;
+
+function refreshTokens() {
+    if (!refreshing) {
+        refreshing = (async () => {
+            const refreshToken = localStorage.getItem('refreshToken');
+            if (!refreshToken) return null;
+            const response = await fetch('/api/token/refresh', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ refresh_token: refreshToken }),
+            });
+            if (!response.ok) return null;
+            const data = await response.json();
+            localStorage.setItem('token', data.access_token);
+            localStorage.setItem('refreshToken', data.refresh_token);
+            return data.access_token;
+        })().catch(() => null).finally(() => { refreshing = null; });
+    }
+    return refreshing;
+}
+
 export function AuthProvider({ children }) {
     const [user, setUser] = useState(null);
     const [token, setToken] = useState(localStorage.getItem('token'));
     const [loading, setLoading] = useState(true);
 
+    // Renew the access token with the refresh token shortly before it expires, instead
+    // of sending the password through /token again. Scheduled from the token's own
+    // expiry, so a reloaded tab does not keep using an expired token.
+    useEffect(() => {
+        if (!token || !localStorage.getItem('refreshToken')) return;
+        const delay = Math.max(0, tokenExpiry(token) * 1000 - Date.now() - REFRESH_MARGIN_MS);
+        const timer = setTimeout(async () => {
+            const freshToken = await refreshTokens();
+            if (freshToken) {
+                setToken(freshToken);
+            } else {
+                logout();
+                window.location.href = '/login';
+            }
+        }, delay);
+        return () => clearTimeout(timer);
+    }, [token]);
+
     useEffect(() => {
         console.log('AuthContext mounted. Token from localStorage:', token);
         const fetchUserInfo = async () => {
             if (token) {
                 try {
-                    const response = await fetch('/api/me', {
+                    const expired = tokenExpiry(token) * 1000 <= Date.now();
+                    const response = expired ? null : await fetch('/api/me', {
                         headers: {
                             'Authorization': `Bearer ${token}`
                         }
                     });
-                    if (response.ok) {
+                    if (!response || response.status === 401) {
+                        // Expired access token: renew it, this effect then runs again with the new one
+                        const freshToken = await refreshTokens();
+                        if (freshToken) {
+                            setToken(freshToken);
+                            return;
+                        }
+                    }
+                    if (response && response.ok) {
                         const userData = await response.json();
                         setUser(userData);
                     } else {
                         // If any error occurs (401, 403, 500), clear token
-                        console.warn('Failed to fetch user info, logging out. Status:', response.status);
+                        console.warn('Failed to fetch user info, logging out. Status:', response && response.status);
                         localStorage.removeItem('token');
                         setToken(null);
                         setUser(null);
@@ -64,6 +127,7 @@ export function AuthProvider({ children }) {
 
         const data = await response.json();
         localStorage.setItem('token', data.access_token);
+        localStorage.setItem('refreshToken', data.refresh_token);
         setToken(data.access_token);
 
         // Fetch user info
@@ -98,6 +162,15 @@ export function AuthProvider({ children }) {
     };
 
     const logout = () => {
+        const refreshToken = localStorage.getItem('refreshToken');
+        if (refreshToken) {
+            fetch('/api/token/revoke', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ refresh_token: refreshToken }),
+            }).catch(() => {});
+            localStorage.removeItem('refreshToken');
+        }
         localStorage.removeItem('token');
         setToken(null);
         setUser(null);
@@ -14,17 +14,48 @@ export function useTickets() {
 export function TicketProvider({ children }) {
     const [tickets, setTickets] = useState([]);
     const [loading, setLoading] = useState(true);
+    const [stats, setStats] = useState({ total: 0, open: 0, inProgress: 0, resolved: 0 });
     const { token } = useAuth();
 
+    // Counters computed server-side over every ticket the user can see
+    const fetchStats = async () => {
+        if (!token) return;
+        try {
+            const response = await fetch('/api/tickets/stats', {
+                headers: {
+                    'Authorization': `Bearer ${token}`
+                }
+            });
+            if (response.ok) {
+                const data = await response.json();
+                setStats({
+                    total: data.total,
+                    open: data.by_status.open || 0,
+                    inProgress: data.by_status.in_progress || 0,
+                    resolved: data.by_status.resolved || 0
+                });
+            }
+        } catch (error) {
+            console.error('Error fetching ticket stats:', error);
+        }
+    };
+
     // Fetch tickets from API
-    const fetchTickets = async () => {
+    // filters: { status, priority, category, owner_role, created_after, created_before }
+    // 'all' or empty values are ignored; filtering happens server-side.
+    const fetchTickets = async (filters = {}) => {
         console.log('Fetching tickets... Token:', !!token);
         if (!token) {
             setLoading(false);
             return;
         }
+        const params = new URLSearchParams();
+        Object.entries(filters).forEach(([key, value]) => {
+            if (value && value !== 'all') params.append(key, value);
+        });
+        const query = params.toString();
         try {
-            const response = await fetch('/api/tickets', {
+            const response = await fetch(query ? `/api/tickets?${query}` : '/api/tickets', {
                 headers: {
                     'Authorization': `Bearer ${token}`
                 }
@@ -46,6 +77,7 @@ export function TicketProvider({ children }) {
 
     useEffect(() => {
         fetchTickets();
+        fetchStats();
     }, [token]);
 
     const addTicket = async (ticketData) => {
@@ -62,6 +94,7 @@ export function TicketProvider({ children }) {
             if (response.ok) {
                 const newTicket = await response.json();
                 setTickets([...tickets, newTicket]);
+                fetchStats();
                 return newTicket;
             }
         } catch (error) {
@@ -83,6 +116,7 @@ export function TicketProvider({ children }) {
                 setTickets(tickets.map(ticket =>
                     ticket.id === id ? updatedTicket : ticket
                 ));
+                fetchStats();
                 return updatedTicket;
             } else {
                 console.error('Failed to update ticket status');
@@ -103,6 +137,7 @@ export function TicketProvider({ children }) {
 
             if (response.ok) {
                 setTickets(tickets.filter(ticket => ticket.id !== id));
+                fetchStats();
                 return true;
             } else {
                 console.error('Failed to delete ticket');
@@ -142,13 +177,6 @@ export function TicketProvider({ children }) {
         }
     };
 
-    const stats = {
-        total: Array.isArray(tickets) ? tickets.length : 0,
-        open: Array.isArray(tickets) ? tickets.filter(t => t.status === 'open').length : 0,
-        inProgress: Array.isArray(tickets) ? tickets.filter(t => t.status === 'in_progress').length : 0,
-        resolved: Array.isArray(tickets) ? tickets.filter(t => t.status === 'resolved').length : 0
-    };
-
     return (
         <TicketContext.Provider value={{
             tickets,
@@ -159,6 +187,7 @@ export function TicketProvider({ children }) {
             deleteTicket,
             getTicketsByCategory,
             stats,
+            fetchStats,
             fetchTickets,
             addComment
         }}>
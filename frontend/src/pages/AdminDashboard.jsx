@@ -18,13 +18,16 @@ export default function AdminDashboard() {
     const [greeting, setGreeting] = useState('');
 
     useEffect(() => {
-        fetchTickets();
         const hour = new Date().getHours();
         if (hour < 12) setGreeting('Bonjour');
         else if (hour < 18) setGreeting('Bon après-midi');
         else setGreeting('Bonsoir');
     }, []);
 
+    useEffect(() => {
+        fetchTickets({ status: filterStatus, category: filterCategory, owner_role: filterRole });
+    }, [filterStatus, filterCategory, filterRole]);
+
     const handleLogout = () => {
         logout();
         navigate('/login');
@@ -64,14 +67,12 @@ export default function AdminDashboard() {
         { label: 'Résolus', value: stats.resolved, icon: CheckCircle, color: 'from-emerald-500 to-teal-600', text: 'text-emerald-100' }
     ];
 
+    // Status, category and role filters are applied by the API (see fetchTickets in TicketContext)
     const filteredTickets = tickets.filter(ticket => {
-        const matchesStatus = filterStatus === 'all' || ticket.status === filterStatus;
-        const matchesCategory = filterCategory === 'all' || ticket.category === filterCategory;
-        const matchesRole = filterRole === 'all' || (ticket.owner && ticket.owner.role === filterRole);
         const matchesSearch = ticket.title.toLowerCase().includes(searchTerm.toLowerCase()) ||
             ticket.description.toLowerCase().includes(searchTerm.toLowerCase()) ||
             ticket.id.toString().includes(searchTerm);
-        return matchesStatus && matchesCategory && matchesRole && matchesSearch;
+        return matchesSearch;
     });
 
     return (
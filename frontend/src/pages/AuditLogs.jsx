@@ -12,23 +12,26 @@ export default function AuditLogs() {
     const [searchTerm, setSearchTerm] = useState('');
 
     const [error, setError] = useState(null);
+    const [nextCursor, setNextCursor] = useState(null);
 
     useEffect(() => {
         fetchLogs();
     }, []);
 
-    const fetchLogs = async () => {
+    // Pagination par curseur : le serveur ne lit que les lignes de la page demandée
+    const fetchLogs = async (cursor = '') => {
         try {
             setError(null);
             // Added trailing slash to ensure correct routing
-            const response = await fetch('/api/audit/', {
+            const response = await fetch(`/api/audit/?limit=100&cursor=${encodeURIComponent(cursor)}`, {
                 headers: {
                     'Authorization': `Bearer ${token}`
                 }
             });
             if (response.ok) {
                 const data = await response.json();
-                setLogs(data);
+                setLogs(prev => cursor ? [...prev, ...data.items] : data.items);
+                setNextCursor(data.next_cursor);
             } else {
                 const text = await response.text();
                 setError(`Erreur ${response.status}: ${text}`);
@@ -171,6 +174,16 @@ export default function AuditLogs() {
                             </tbody>
                         </table>
                     </div>
+                    {nextCursor && (
+                        <div className="p-4 border-t border-white/10 flex justify-center">
+                            <button
+                                onClick={() => fetchLogs(nextCursor)}
+                                className="px-4 py-2 rounded-xl bg-slate-800 hover:bg-slate-700 text-sm font-medium text-slate-200 transition-colors"
+                            >
+                                Charger plus
+                            </button>
+                        </div>
+                    )}
                 </div>
             </div>
         </div>